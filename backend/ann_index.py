@@ -0,0 +1,138 @@
+import math
+import faiss
+import numpy as np
+from quantization import quantization_mode
+from config import ANN_INDEX_TYPE, ANN_FLAT_MAX, ANN_HNSW_MAX, ANN_NLIST, ANN_NPROBE, ANN_HNSW_M, ANN_EF_CONSTRUCTION, ANN_EF_SEARCH, ANN_PQ_M
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# FAISS scalar quantizer used for each embedding quantization mode
+SCALAR_QUANTIZERS = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+# FAISS needs roughly this many training points per IVF list (and 256 per PQ code)
+MIN_POINTS_PER_LIST = 39
+MIN_PQ_TRAINING_POINTS = 256
+
+
+def choose_index_type(n_vectors, index_type=None):
+    """Pick the index type for a corpus size; an explicit type (argument or ANN_INDEX_TYPE) wins."""
+    index_type = index_type or ANN_INDEX_TYPE
+    if index_type != "auto":
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected auto or one of {', '.join(INDEX_TYPES)}")
+        return index_type
+    if n_vectors < ANN_FLAT_MAX:
+        return "flat"
+    if n_vectors < ANN_HNSW_MAX:
+        return "hnsw"
+    return "ivf_pq"
+
+
+def resolve_index_type(n_vectors, index_type=None, nlist=None):
+    """Index type build_index produces for a corpus size, after falling back to flat for corpora too small to train."""
+    index_type = choose_index_type(n_vectors, index_type)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or ANN_NLIST or default_nlist(n_vectors)
+        if n_vectors < nlist * MIN_POINTS_PER_LIST or (index_type == "ivf_pq" and n_vectors < MIN_PQ_TRAINING_POINTS):
+            return "flat"
+    return index_type
+
+
+def default_nlist(n_vectors):
+    """About 4 * sqrt(n) lists, capped so every list gets enough training points."""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // MIN_POINTS_PER_LIST))
+
+
+def default_pq_m(dimension):
+    """Largest number of PQ sub-quantizers dividing the dimension with at least 8 dimensions each."""
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def index_type_of(index):
+    """Name of the index type of a FAISS index (one of INDEX_TYPES, or the FAISS class name)."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, (faiss.IndexIVFFlat, faiss.IndexIVFScalarQuantizer)):
+        return "ivf_flat"
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        return "flat"
+    return type(index).__name__
+
+
+def index_quantization_of(index):
+    """How an index stores its vectors: none (float32), float16, int8 or pq."""
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        for mode, qtype in SCALAR_QUANTIZERS.items():
+            if index.sq.qtype == qtype:
+                return mode
+    return "none"
+
+
+def index_matches(index, n_vectors, quantization=None):
+    """
+    True when `index` has the type and vector storage build_index would choose for `n_vectors`,
+    so it can be updated in place instead of rebuilt.
+    """
+    index_type = resolve_index_type(n_vectors)
+    storage = "pq" if index_type == "ivf_pq" else quantization_mode(quantization)
+    return index_type_of(index) == index_type and index_quantization_of(index) == storage
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """Apply search-time parameters (nprobe for IVF, efSearch for HNSW) to an index."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(nprobe or ANN_NPROBE, index.nlist)
+        if index.direct_map.type == faiss.DirectMap.NoMap:
+            # Needed for reconstruct(), which /rag uses to read stored vectors back
+            index.make_direct_map()
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or ANN_EF_SEARCH
+    return index
+
+
+def build_index(embeddings, index_type=None, nlist=None, nprobe=None, m=None,
+                ef_construction=None, ef_search=None, pq_m=None, quantization=None):
+    """
+    Build a FAISS index (L2, like the flat index LangChain creates) over the embeddings,
+    in row order so positions keep matching the chunk store. Corpora too small to train
+    the requested index type get a flat index. With float16 or int8 `quantization`
+    (default EMBEDDING_QUANTIZATION), flat, IVF-Flat and HNSW store scalar-quantized vectors.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n_vectors, dimension = embeddings.shape
+    index_type = resolve_index_type(n_vectors, index_type, nlist)
+    qtype = SCALAR_QUANTIZERS.get(quantization_mode(quantization))
+    nlist = nlist or ANN_NLIST or default_nlist(n_vectors)
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension) if qtype is None else faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_L2)
+    elif index_type == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dimension, m or ANN_HNSW_M)
+        else:
+            index = faiss.IndexHNSWSQ(dimension, qtype, m or ANN_HNSW_M)
+        index.hnsw.efConstruction = ef_construction or ANN_EF_CONSTRUCTION
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat" and qtype is None:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        elif index_type == "ivf_flat":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, qtype, faiss.METRIC_L2)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m or ANN_PQ_M or default_pq_m(dimension), 8)
+
+    if not index.is_trained:
+        index.train(embeddings)
+
+    if n_vectors:
+        index.add(embeddings)
+    return configure_search(index, nprobe=nprobe, ef_search=ef_search)
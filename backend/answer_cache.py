@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticAnswerCache:
+    """
+    Cache of LLM answers keyed by subject, index version and query embedding.
+    A lookup hits when a cached query of the same subject and index version has
+    cosine similarity >= threshold with the new query. Entries expire after `ttl`
+    seconds and the least recently used are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # entry id -> entry, least recently used first
+        self._buckets = {}              # (subject, index version) -> [entry id]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, subject, version, query_vector):
+        """Return (answer, similarity) for the closest cached query, or None on a miss."""
+        query_vector = _normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get((subject, version), [])
+            for entry_id in [entry_id for entry_id in bucket if now - self._entries[entry_id]["created_at"] > self.ttl]:
+                self._remove(entry_id)
+            bucket = self._buckets.get((subject, version), [])
+
+            if bucket:
+                vectors = np.vstack([self._entries[entry_id]["vector"] for entry_id in bucket])
+                similarities = vectors @ query_vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id = bucket[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id]["answer"], float(similarities[best])
+
+            self.misses += 1
+            return None
+
+    def store(self, subject, version, query_vector, query, answer):
+        """Cache the answer generated for a query."""
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "key": (subject, version),
+                "vector": _normalize(query_vector),
+                "query": query,
+                "answer": answer,
+                "created_at": time.time(),
+            }
+            self._buckets.setdefault((subject, version), []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, subject):
+        """Drop every cached answer for a subject, e.g. after it is re-chunked."""
+        with self._lock:
+            for key in [key for key in self._buckets if key[0] == subject]:
+                for entry_id in list(self._buckets[key]):
+                    self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets[entry["key"]]
+        bucket.remove(entry_id)
+        if not bucket:
+            del self._buckets[entry["key"]]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
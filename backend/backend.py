@@ -1,8 +1,9 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import pymysql
-import bcrypt
 import json
+from db_pool import ConnectionPool
+from passwords import PasswordHasher, HasherBusy
 app = Flask(__name__)
 CORS(app)
 
@@ -13,7 +14,7 @@ DB_PASSWORD = "Pr@040903"  # Replace with your MySQL root password
 DB_NAME = "users1"
 
 # Connect to the MySQL database
-def get_db_connection():
+def open_db_connection():
     connection = pymysql.connect(
         host=DB_HOST,
         user=DB_USER,
@@ -23,6 +24,29 @@ def get_db_connection():
     )
     return connection
 
+# Connections are reused across requests; leaving `with get_db_connection() as conn:` returns them to the pool
+db_pool = ConnectionPool(open_db_connection)
+
+def get_db_connection():
+    return db_pool.get()
+
+# bcrypt runs on a bounded worker pool instead of the request thread
+password_hasher = PasswordHasher()
+
+# Response for requests rejected because the password hasher is saturated
+def hasher_busy_response(error):
+    return jsonify({"error": str(error)}), 503, {"Retry-After": "1"}
+
+# Create an index unless it already exists (MySQL has no CREATE INDEX IF NOT EXISTS)
+def ensure_index(cursor, table, name, columns):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """, (table, name))
+    if not cursor.fetchone():
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
 # Initialize the MySQL database
 def init_db():
     conn = get_db_connection()
@@ -57,10 +81,51 @@ def init_db():
 )
 
         """)
+
+        # Keyset pagination filtered by creator walks this index in id order
+        ensure_index(cursor, "classes", "idx_classes_created_by_id", "created_by, id")
     conn.commit()
     conn.close()
 
 init_db()
+db_pool.fill()
+
+# Pagination for class listings (?after=<id>&limit=<n>)
+CLASSES_DEFAULT_LIMIT = 50
+CLASSES_MAX_LIMIT = 200
+
+# Columns that may be requested with ?fields=
+CLASS_FIELDS = ["id", "title", "teacher", "description", "totalHours", "number_of_assessments", "assessments", "created_by"]
+
+def fetch_class_page(columns):
+    """
+    Fetch one page of classes in id order, starting after the ?after= cursor.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Supports ?limit= and ?created_by= filtering.
+    """
+    after = request.args.get("after", default=0, type=int)
+    limit = request.args.get("limit", default=CLASSES_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, CLASSES_MAX_LIMIT))
+    created_by = request.args.get("created_by", type=int)
+
+    if "id" not in columns:
+        columns = ["id"] + columns
+    query = f"SELECT {', '.join(columns)} FROM classes WHERE id > %s"
+    params = [after]
+    if created_by is not None:
+        query += " AND created_by = %s"
+        params.append(created_by)
+    # Fetch one extra row to know whether there is another page
+    query += " ORDER BY id LIMIT %s"
+    params.append(limit + 1)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    return rows[:limit], next_cursor
 
 # Signup API
 @app.route("/signup", methods=["POST"])
@@ -75,17 +140,19 @@ def signup():
     role = data.get("role", "student")  # Default role is "student"
 
     # Hash the password
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    try:
+        hashed_password = password_hasher.hash(password)
+    except HasherBusy as e:
+        return hasher_busy_response(e)
 
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO users (email, password, first_name, last_name, school_name, country, role)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (email, hashed_password, first_name, last_name, school_name, country, role))
-        conn.commit()
-        conn.close()
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO users (email, password, first_name, last_name, school_name, country, role)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (email, hashed_password, first_name, last_name, school_name, country, role))
+            conn.commit()
         return jsonify({"message": "Signup successful"}), 201
     except pymysql.err.IntegrityError:
         return jsonify({"error": "Email already exists"}), 400
@@ -99,13 +166,24 @@ def login():
     email = data.get("email")
     password = data.get("password")
 
-    conn = get_db_connection()
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-    conn.close()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+            user = cursor.fetchone()
+
+    try:
+        valid = bool(user) and password_hasher.verify(password, user["password"])
+    except HasherBusy as e:
+        return hasher_busy_response(e)
+
+    if valid:
+        # Upgrade hashes made with a different cost factor while we have the plain password
+        if password_hasher.needs_rehash(user["password"]):
+            try:
+                rehash_password(user["id"], password)
+            except Exception as e:
+                print(f"Rehash for user {user['id']} failed: {e}")
 
-    if user and bcrypt.checkpw(password.encode("utf-8"), user["password"].encode("utf-8")):
         return jsonify({
             "message": "Login successful",
             "userId": user["id"],  # Return user ID
@@ -115,6 +193,13 @@ def login():
     else:
         return jsonify({"error": "Invalid email or password"}), 401
 
+def rehash_password(user_id, password):
+    hashed_password = password_hasher.rehash(password)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE users SET password = %s WHERE id = %s", (hashed_password, user_id))
+        conn.commit()
+
 # Create Class API
 @app.route("/classes", methods=["POST"])
 def create_class():
@@ -134,87 +219,71 @@ def create_class():
         return jsonify({"error": "All fields are required!"}), 400
 
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # Insert data into the classes table
-            cursor.execute("""
-                INSERT INTO classes (title, teacher, description,totalHours, number_of_assessments, assessments, created_by)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (title, teacher, description, total_hours, number_of_assessments, json.dumps(assessments), created_by))
-            conn.commit()
-            new_class_id = cursor.lastrowid
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Insert data into the classes table
+                cursor.execute("""
+                    INSERT INTO classes (title, teacher, description,totalHours, number_of_assessments, assessments, created_by)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (title, teacher, description, total_hours, number_of_assessments, json.dumps(assessments), created_by))
+                conn.commit()
+                new_class_id = cursor.lastrowid
 
         return jsonify({"message": "Class created successfully!", "classId": new_class_id}), 201
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-
-    finally:
-        conn.close()
 @app.route('/assessments', methods=['GET'])
 def get_assessments():
     """Endpoint to retrieve assessments of all classes grouped by class name."""
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # Fetch class data including assessments (stored as JSON)
-            cursor.execute("SELECT title, assessments FROM classes")
-            class_data = cursor.fetchall()
+        # Fetch class data including assessments (stored as JSON), one page at a time
+        class_data, next_cursor = fetch_class_page(["title", "assessments"])
 
         if class_data:
             # Process assessments from JSON to list and group by class name
             for class_info in class_data:
                 class_info['assessments'] = json.loads(class_info['assessments'])
 
-            return jsonify({"classes": class_data}), 200
+            return jsonify({"classes": class_data, "nextCursor": next_cursor}), 200
         else:
             return jsonify({"error": "No classes found"}), 404
     except Exception as e:
         print(f"Error fetching assessments: {e}")
         return jsonify({"error": "Internal server error"}), 500
-    finally:
-        conn.close()
 
 @app.route('/total-hours', methods=['GET'])
 def get_total_hours():
     """Endpoint to retrieve total hours of all classes grouped by class name."""
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # Fetch class data including total_hours
-            cursor.execute("SELECT title, totalHours FROM classes")
-            class_data = cursor.fetchall()
+        # Fetch class data including total_hours, one page at a time
+        class_data, next_cursor = fetch_class_page(["title", "totalHours"])
 
         if class_data:
-            return jsonify({"classes": class_data}), 200
+            return jsonify({"classes": class_data, "nextCursor": next_cursor}), 200
         else:
             return jsonify({"error": "No classes found"}), 404
     except Exception as e:
         print(f"Error fetching total hours: {e}")
         return jsonify({"error": "Internal server error"}), 500
-    finally:
-        conn.close()
 
 # Get All Classes API
 @app.route("/classes", methods=["GET"])
 def get_classes():
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT *
-                FROM classes
-            """)
-            classes = cursor.fetchall()
+    # Only return the requested columns (?fields=id,title,teacher); all columns by default
+    fields = request.args.get("fields")
+    columns = [field.strip() for field in fields.split(",") if field.strip()] if fields else CLASS_FIELDS
+    unknown = [column for column in columns if column not in CLASS_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
 
-        return jsonify({"classes": classes}), 200
+    try:
+        classes, next_cursor = fetch_class_page(columns)
+        return jsonify({"classes": classes, "nextCursor": next_cursor}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        conn.close()
-
 # Profile API
 @app.route("/profile", methods=["GET"])
 def profile():
@@ -224,14 +293,13 @@ def profile():
         return jsonify({"error": "Unauthorized"}), 401
 
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT email, first_name, last_name, school_name, country, role 
-                FROM users WHERE id = %s
-            """, (user_id,))
-            user = cursor.fetchone()
-        conn.close()
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT email, first_name, last_name, school_name, country, role 
+                    FROM users WHERE id = %s
+                """, (user_id,))
+                user = cursor.fetchone()
 
         if user:
             return jsonify({"user": user}), 200
@@ -244,11 +312,10 @@ def profile():
 def get_class_by_id(class_id):
     """Endpoint to retrieve a class by its ID."""
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM classes WHERE id = %s", (class_id,))
-            class_data = cursor.fetchone()
-        conn.close()
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT * FROM classes WHERE id = %s", (class_id,))
+                class_data = cursor.fetchone()
 
         if class_data:
             return jsonify({"class": class_data}), 200
@@ -277,23 +344,23 @@ def update_profile():
         return jsonify({"error": "All fields are required!"}), 400
 
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # Update the user's profile details in the database
-            cursor.execute("""
-                UPDATE users
-                SET first_name = %s, last_name = %s, school_name = %s, country = %s, email = %s
-                WHERE id = %s
-            """, (first_name, last_name, school_name, country, email, user_id))
-            conn.commit()
-
-            # Fetch the updated profile details
-            cursor.execute("""
-                SELECT email, first_name, last_name, school_name, country, role
-                FROM users
-                WHERE id = %s
-            """, (user_id,))
-            updated_user = cursor.fetchone()
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Update the user's profile details in the database
+                cursor.execute("""
+                    UPDATE users
+                    SET first_name = %s, last_name = %s, school_name = %s, country = %s, email = %s
+                    WHERE id = %s
+                """, (first_name, last_name, school_name, country, email, user_id))
+                conn.commit()
+
+                # Fetch the updated profile details
+                cursor.execute("""
+                    SELECT email, first_name, last_name, school_name, country, role
+                    FROM users
+                    WHERE id = %s
+                """, (user_id,))
+                updated_user = cursor.fetchone()
 
         if updated_user:
             return jsonify({
@@ -307,25 +374,22 @@ def update_profile():
         print(f"Error updating profile: {e}")  # Log the error
         return jsonify({"error": "Internal server error"}), 500
 
-    finally:
-        conn.close()
-
 @app.route('/classes/<int:class_id>', methods=['DELETE'])
 def delete_class(class_id):
     """Endpoint to delete a class by its ID."""
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # Check if the class exists
-            cursor.execute("SELECT * FROM classes WHERE id = %s", (class_id,))
-            class_data = cursor.fetchone()
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Check if the class exists
+                cursor.execute("SELECT * FROM classes WHERE id = %s", (class_id,))
+                class_data = cursor.fetchone()
 
-            if not class_data:
-                return jsonify({"error": "Class not found"}), 404
+                if not class_data:
+                    return jsonify({"error": "Class not found"}), 404
 
-            # Delete the class
-            cursor.execute("DELETE FROM classes WHERE id = %s", (class_id,))
-            conn.commit()
+                # Delete the class
+                cursor.execute("DELETE FROM classes WHERE id = %s", (class_id,))
+                conn.commit()
 
         return jsonify({"message": "Class deleted successfully"}), 200
 
@@ -333,8 +397,10 @@ def delete_class(class_id):
         print(f"Error deleting class: {e}")  # Log the error
         return jsonify({"error": "Internal server error"}), 500
 
-    finally:
-        conn.close()
+# Connection pool statistics
+@app.route("/stats", methods=["GET"])
+def pool_stats():
+    return jsonify({"db_pool": db_pool.stats(), "password_hasher": password_hasher.stats()}), 200
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
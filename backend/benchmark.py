@@ -0,0 +1,543 @@
+"""
+Benchmarks for the RAG backend.
+
+Run from the backend/ directory:
+    python benchmark.py ingest [--pdfs uploads] [--repeat 3]
+    python benchmark.py scheduler [--requests 40] [--concurrency 2] [--latency 0.2]
+    python benchmark.py passwords [--seconds 10] [--clients 16] [--rounds 12]
+    python benchmark.py ann [--subject uploads/<subject>/vector_store | --synthetic 100000] [--k 5]
+    python benchmark.py quantization [--subject uploads/<subject>/vector_store | --synthetic 20000] [--k 5]
+    python benchmark.py e2e [--scales 1,10] [--latency 0.05] [--baseline benchmark_baseline.json] [--save-baseline]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from embedding_registry import get_embedding_model
+from ingestion import load_and_split, embed_texts, build_vector_store
+from chunk_store import open_chunks
+from ann_index import build_index, configure_search
+from quantization import quantize, dequantize
+from passwords import PasswordHasher, HasherBusy
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+
+class StubLLM:
+    """
+    Deterministic stand-in for the local model server: sleeps `latency` seconds per call
+    and tracks peak concurrency. Quiz prompts get valid quiz JSON, other prompts a fixed answer.
+    """
+
+    def __init__(self, latency=0.2, tokens=20):
+        self.latency = latency
+        self.tokens = tokens
+        self.calls = 0
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+
+    def respond(self, prompt):
+        match = re.search(r"Generate exactly (\d+) multiple-choice", prompt)
+        if match is None:
+            return f"Answer to: {prompt[:40]}"
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return json.dumps([
+            {"question": f"Question {digest}-{i}?", "options": ["A", "B", "C", "D"], "answer": "A"}
+            for i in range(int(match.group(1)))
+        ])
+
+    def invoke(self, prompt):
+        self._enter()
+        try:
+            time.sleep(self.latency)
+            return self.respond(prompt)
+        finally:
+            self._exit()
+
+    def stream(self, prompt):
+        self._enter()
+        try:
+            words = self.respond(prompt).split(" ")
+            for i, word in enumerate(words):
+                time.sleep(self.latency / len(words))
+                yield word if i == len(words) - 1 else word + " "
+        finally:
+            self._exit()
+
+
+def find_pdfs(folder):
+    """Return every PDF under a folder, sorted for a stable order."""
+    return sorted(glob.glob(os.path.join(folder, "**", "*.pdf"), recursive=True))
+
+
+def best_of(repeat, fn):
+    """Run fn `repeat` times and return the fastest wall time in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_ingest(args):
+    """Compare the old two-pass /chunk embedding with the single-pass ingestion pipeline."""
+    pdfs = find_pdfs(args.pdfs)
+    if not pdfs:
+        print(f"No PDFs found under {args.pdfs}")
+        return
+
+    start = time.perf_counter()
+    chunks = [chunk for pdf in pdfs for chunk in load_and_split(pdf)]
+    parse_seconds = time.perf_counter() - start
+    texts = [chunk.page_content for chunk in chunks]
+
+    embedding_model = get_embedding_model()
+    embedding_model.embed_documents(texts[:1])  # Warm up before timing
+
+    def two_pass():
+        # What /chunk used to do: embed for chunked_data, then embed again inside from_documents
+        embedding_model.embed_documents(texts)
+        FAISS.from_documents(chunks, embedding=embedding_model)
+
+    def single_pass():
+        embeddings = embed_texts(texts, embedding_model)
+        build_vector_store(chunks, embeddings, embedding_model)
+
+    two_pass_seconds = best_of(args.repeat, two_pass)
+    single_pass_seconds = best_of(args.repeat, single_pass)
+
+    print(f"PDFs: {len(pdfs)}  chunks: {len(chunks)}  parse+split: {parse_seconds:.2f}s")
+    print(f"two-pass embed+index:    {two_pass_seconds:.2f}s")
+    print(f"single-pass embed+index: {single_pass_seconds:.2f}s")
+    print(f"reduction: {100 * (1 - single_pass_seconds / two_pass_seconds):.1f}%")
+
+
+def bench_scheduler(args):
+    """Send a burst of /rag-like and quiz-like calls through the LLM scheduler against a stub model."""
+    llm = StubLLM(latency=args.latency)
+    scheduler = LLMScheduler(concurrency=args.concurrency, timeout=60)
+    # Every fourth prompt repeats an earlier one, so coalescing has something to merge
+    prompts = [f"question {i % max(1, args.requests * 3 // 4)}" for i in range(args.requests)]
+    priorities = [PRIORITY_BACKGROUND if i % 2 else PRIORITY_INTERACTIVE for i in range(args.requests)]
+    latencies = {PRIORITY_INTERACTIVE: [], PRIORITY_BACKGROUND: []}
+
+    def call(prompt, priority):
+        start = time.perf_counter()
+        scheduler.invoke(llm, prompt, priority=priority)
+        latencies[priority].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.requests) as executor:
+        list(executor.map(call, prompts, priorities))
+    elapsed = time.perf_counter() - start
+
+    stats = scheduler.stats()
+    print(f"requests: {args.requests}  model calls: {llm.calls}  coalesced: {stats['coalesced']}")
+    print(f"peak concurrent generations: {llm.peak_active} (cap {args.concurrency})")
+    print(f"wall time: {elapsed:.2f}s  mean queue wait: {stats['wait_seconds']['mean'] * 1000:.0f}ms")
+    for priority, name in ((PRIORITY_INTERACTIVE, "interactive"), (PRIORITY_BACKGROUND, "background")):
+        values = latencies[priority]
+        if values:
+            print(f"{name:>11} mean latency: {1000 * sum(values) / len(values):.0f}ms")
+
+
+def bench_passwords(args):
+    """Sustained logins/sec (bcrypt verify) through the bounded password hasher."""
+    hasher = PasswordHasher(rounds=args.rounds)
+    hashed = hasher.hash("correct horse battery staple")
+    latencies = []
+    rejected = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                hasher.verify("correct horse battery staple", hashed)
+            except HasherBusy:
+                with lock:
+                    rejected[0] += 1
+                time.sleep(0.01)  # What a client honouring Retry-After would do, scaled down
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"cost: {args.rounds}  workers: {hasher.workers}  max pending: {hasher.max_pending}  clients: {args.clients}")
+    print(f"logins: {len(latencies)} in {elapsed:.1f}s = {len(latencies) / elapsed:.1f}/s  rejected (503): {rejected[0]}")
+    if latencies:
+        print(f"latency p50: {1000 * latencies[len(latencies) // 2]:.0f}ms  "
+              f"p95: {1000 * latencies[int(len(latencies) * 0.95)]:.0f}ms")
+
+
+def recall_at_k(found, truth):
+    """Fraction of the exact top-k neighbours that an approximate search returned."""
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def load_corpus(args):
+    """Embeddings of a subject's chunk store, or clustered synthetic vectors; plus perturbed queries."""
+    if args.subject:
+        chunks = open_chunks(args.subject)
+        if chunks is None:
+            return None, None
+        corpus = np.asarray(chunks.embeddings, dtype=np.float32)
+    else:
+        # Clustered random vectors, roughly like sentence embeddings of a few topics
+        rng = np.random.default_rng(42)
+        centers = rng.standard_normal((max(1, args.synthetic // 500), args.dim)).astype(np.float32)
+        corpus = centers[rng.integers(len(centers), size=args.synthetic)]
+        corpus += 0.5 * rng.standard_normal(corpus.shape).astype(np.float32)
+
+    # Queries: perturbed corpus vectors, so they resemble real questions about the material
+    rng = np.random.default_rng(7)
+    queries = corpus[rng.integers(len(corpus), size=args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    return corpus, queries
+
+
+def bench_ann(args):
+    """recall@k and per-query latency of each approximate index type against the flat baseline."""
+    corpus, queries = load_corpus(args)
+    if corpus is None:
+        print(f"No vector store at {args.subject}")
+        return
+    k = min(args.k, len(corpus))
+
+    _, truth = build_index(corpus, "flat").search(queries, k)
+
+    configurations = [("flat", {})]
+    configurations += [("ivf_flat", {"nprobe": nprobe}) for nprobe in (1, 4, 16, 64)]
+    configurations += [("hnsw", {"ef_search": ef}) for ef in (16, 32, 64, 128)]
+    configurations += [("ivf_pq", {"nprobe": nprobe}) for nprobe in (4, 16, 64)]
+
+    print(f"vectors: {len(corpus)}  dim: {corpus.shape[1]}  queries: {len(queries)}  k: {k}")
+    print(f"{'index':<10} {'params':<14} {'build s':>8} {'MiB':>8} {'ms/query':>9} {'recall@k':>9}")
+    built = {}
+    for index_type, params in configurations:
+        if index_type not in built:
+            start = time.perf_counter()
+            built[index_type] = (build_index(corpus, index_type), time.perf_counter() - start)
+        index, build_seconds = built[index_type]
+        configure_search(index, **params)
+
+        # One query at a time, like /rag
+        start = time.perf_counter()
+        found = np.vstack([index.search(query[None, :], k)[1] for query in queries])
+        per_query_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+        size_mib = faiss.serialize_index(index).nbytes / 2 ** 20
+        label = ", ".join(f"{name}={value}" for name, value in params.items()) or "-"
+        print(f"{index_type:<10} {label:<14} {build_seconds:>8.2f} {size_mib:>8.1f} {per_query_ms:>9.3f} "
+              f"{recall_at_k(found, truth):>9.3f}")
+
+
+def bench_quantization(args):
+    """Memory and retrieval quality of float16 / int8 embeddings against full float32 precision."""
+    corpus, queries = load_corpus(args)
+    if corpus is None:
+        print(f"No vector store at {args.subject}")
+        return
+    k = min(args.k, len(corpus))
+    _, truth = build_index(corpus, "flat", quantization="none").search(queries, k)
+
+    print(f"vectors: {len(corpus)}  dim: {corpus.shape[1]}  queries: {len(queries)}  k: {k}")
+    print(f"{'precision':<10} {'stored MiB':>10} {'index MiB':>10} {'max error':>10} {'recall@k':>9} {'stored recall':>14}")
+    for mode in ("none", "float16", "int8"):
+        codes, scale = quantize(corpus, mode)
+        restored = dequantize(codes, scale)
+        stored_bytes = codes.nbytes + (scale.nbytes if scale is not None else 0)
+
+        # recall of the quantized FAISS index, and of an exact index rebuilt from the stored embeddings
+        index = build_index(corpus, "flat", quantization=mode)
+        _, found = index.search(queries, k)
+        _, found_stored = build_index(restored, "flat", quantization="none").search(queries, k)
+
+        print(f"{mode:<10} {stored_bytes / 2 ** 20:>10.2f} {faiss.serialize_index(index).nbytes / 2 ** 20:>10.2f} "
+              f"{float(np.abs(restored - corpus).max()):>10.5f} {recall_at_k(found, truth):>9.3f} "
+              f"{recall_at_k(found_stored, truth):>14.3f}")
+
+
+def percentiles(values):
+    """p50/p95/p99 (nearest rank) of a list of numbers."""
+    if not values:
+        return {}
+    values = sorted(values)
+    return {f"p{p}": round(values[min(len(values) - 1, int(len(values) * p / 100))], 2) for p in (50, 95, 99)}
+
+
+def peak_rss_mib():
+    """Peak resident set size of this process, or None where the resource module is unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def scale_subject(rag_pipeline, source_subject, subject, factor):
+    """
+    Write a synthetic subject holding `factor` copies of another subject's chunks.
+    Copies get a variant prefix and slightly perturbed vectors, so retrieval and t-SNE
+    run over a corpus `factor` times larger without re-parsing or re-embedding.
+    """
+    from chunk_store import save_chunks, new_stamp
+    from vector_store_cache import save_index
+    from langchain_core.documents import Document
+
+    source = open_chunks(os.path.join(rag_pipeline.UPLOAD_FOLDER, source_subject, "vector_store"))
+    rng = np.random.default_rng(factor)
+    documents, ids, parts = [], [], []
+    for copy in range(factor):
+        for i, doc in enumerate(source.documents()):
+            documents.append(Document(page_content=f"[variant {copy}] {doc.page_content}", metadata=doc.metadata))
+            ids.append(f"scaled-{copy}-{i}")
+        parts.append(source.embeddings + 0.01 * rng.standard_normal(source.embeddings.shape).astype(np.float32))
+    embeddings = np.vstack(parts)
+
+    vector_store_file = os.path.join(rag_pipeline.UPLOAD_FOLDER, subject, "vector_store")
+    vector_store = build_vector_store(documents, embeddings, ids=ids)
+    vector_store.index = build_index(embeddings)
+    stamp = new_stamp()
+    save_chunks(vector_store_file, ids, [doc.page_content for doc in documents], [doc.metadata for doc in documents], embeddings, stamp=stamp)
+    save_index(vector_store, vector_store_file, stamp)
+    return len(documents)
+
+
+def bench_e2e(args):
+    """
+    Drive /chunk, /rag, /tsne and /generate_quiz through the Flask test client with a stub LLM,
+    on the bundled PDFs and on synthetically scaled copies. Reports latency percentiles per
+    endpoint and stage, throughput and peak RSS, and compares them with a stored baseline.
+    """
+    import rag_pipeline
+    from chunk_cache import chunk_cache
+    from tsne_layout import invalidate_layout
+
+    pdfs = [os.path.abspath(pdf) for pdf in find_pdfs(args.pdfs) if "_benchmark" not in pdf]
+    if not pdfs:
+        print(f"No PDFs found under {args.pdfs}")
+        return
+
+    # Scratch subjects and a private chunk cache, so runs do not touch real data or warm each other up
+    chunk_cache.folder = tempfile.mkdtemp(prefix="benchmark-chunks-")
+    rag_pipeline.ollama_llm = StubLLM(latency=args.latency)
+    client = rag_pipeline.app.test_client()
+    base_subject = "_benchmark"
+    scratch = [base_subject]
+    results = {"config": {"pdfs": len(pdfs), "latency": args.latency, "queries": args.queries, "scales": args.scales}}
+    metrics = {}
+
+    def record(name, values):
+        metrics[name] = percentiles(values)
+
+    try:
+        # Ingestion: one /chunk job over every bundled PDF
+        start = time.perf_counter()
+        job = client.post("/chunk", json={"filePaths": pdfs, "subject": base_subject}).get_json()
+        while job["status"] not in ("done", "failed"):
+            time.sleep(0.05)
+            job = client.get(f"/jobs/{job['jobId']}").get_json()
+        ingest_seconds = time.perf_counter() - start
+        if job["status"] == "failed":
+            print(f"/chunk failed: {job['error']}")
+            return
+        total_chunks = len(open_chunks(os.path.join(rag_pipeline.UPLOAD_FOLDER, base_subject, "vector_store")))
+        record("chunk.total_ms", [ingest_seconds * 1000])
+        for stage, ms in job["result"]["timings"].items():
+            record(f"chunk.{stage}_ms", [ms])
+        results["throughput"] = {"chunks_per_sec": round(total_chunks / ingest_seconds, 1)}
+
+        for factor in [int(scale) for scale in args.scales.split(",")]:
+            subject = base_subject if factor == 1 else f"{base_subject}_x{factor}"
+            if factor != 1:
+                scratch.append(subject)
+                scale_subject(rag_pipeline, base_subject, subject, factor)
+            chunks = open_chunks(os.path.join(rag_pipeline.UPLOAD_FOLDER, subject, "vector_store"))
+            prefix = f"x{factor}"
+
+            # Deterministic questions: the opening words of chunks spread over the corpus
+            step = max(1, len(chunks) // args.queries)
+            queries = [" ".join(chunks.text(i).split()[:8]) for i in range(0, len(chunks), step)][:args.queries]
+
+            # /tsne: first call computes the layout, the rest reuse it. /chunk already saved a
+            # layout for the base subject, so drop it to time a real cold call
+            invalidate_layout(os.path.join(rag_pipeline.UPLOAD_FOLDER, subject, "vector_store"))
+            tsne_ms = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                client.post("/tsne", json={"subject": subject})
+                tsne_ms.append((time.perf_counter() - start) * 1000)
+            record(f"{prefix}.tsne.cold_ms", tsne_ms[:1])
+            record(f"{prefix}.tsne.warm_ms", tsne_ms[1:])
+
+            # /rag, sequentially, with per-stage timings from the response
+            stage_ms, total_ms = {}, []
+            for query in queries:
+                start = time.perf_counter()
+                response = client.post("/rag", json={"subject": subject, "query": query, "cache": False}).get_json()
+                total_ms.append((time.perf_counter() - start) * 1000)
+                for stage, ms in response.get("timings", {}).items():
+                    stage_ms.setdefault(stage, []).append(ms)
+            record(f"{prefix}.rag.total_ms", total_ms)
+            for stage, values in stage_ms.items():
+                record(f"{prefix}.rag.{stage}_ms", values)
+
+            # /rag throughput with concurrent clients (bounded by the LLM scheduler)
+            def ask(query):
+                rag_pipeline.app.test_client().post("/rag", json={"subject": subject, "query": query, "cache": False, "visualize": False})
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clients) as executor:
+                list(executor.map(ask, queries))
+            results["throughput"][f"{prefix}.rag_qps"] = round(len(queries) / (time.perf_counter() - start), 2)
+
+        # /generate_quiz, once the background quiz pool for the bundled PDFs is built
+        deadline = time.perf_counter() + 120
+        while base_subject in rag_pipeline.quiz_pool.stats()["filling"] and time.perf_counter() < deadline:
+            time.sleep(0.1)
+        quiz_ms = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            client.post("/generate_quiz", json={"subject": base_subject, "num_questions": 10})
+            quiz_ms.append((time.perf_counter() - start) * 1000)
+        record("quiz.total_ms", quiz_ms)
+    finally:
+        for subject in scratch:
+            shutil.rmtree(os.path.join(rag_pipeline.UPLOAD_FOLDER, subject), ignore_errors=True)
+        shutil.rmtree(chunk_cache.folder, ignore_errors=True)
+
+    results["metrics"] = metrics
+    results["peak_rss_mib"] = peak_rss_mib()
+
+    print(f"{'metric':<36} {'p50':>10} {'p95':>10} {'p99':>10}")
+    for name, values in metrics.items():
+        print(f"{name:<36} {values.get('p50', ''):>10} {values.get('p95', ''):>10} {values.get('p99', ''):>10}")
+    for name, value in results["throughput"].items():
+        print(f"{name:<36} {value:>10}")
+    print(f"{'peak_rss_mib':<36} {results['peak_rss_mib']:>10}")
+
+    regressions = compare_with_baseline(results, args.baseline, args.tolerance) if os.path.exists(args.baseline) else None
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    elif regressions is not None:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """List metrics that are worse than the baseline by more than `tolerance` (a fraction)."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    # Latencies and memory: lower is better
+    for name, values in results["metrics"].items():
+        for percentile in ("p50", "p95"):
+            old, new = baseline.get("metrics", {}).get(name, {}).get(percentile), values.get(percentile)
+            # Ignore sub-millisecond stages, whose relative jitter is meaningless
+            if old and new is not None and new > old * (1 + tolerance) and new - old > 1:
+                regressions.append(f"{name} {percentile}: {old} -> {new}")
+    old, new = baseline.get("peak_rss_mib"), results["peak_rss_mib"]
+    if old and new is not None and new > old * (1 + tolerance):
+        regressions.append(f"peak_rss_mib: {old} -> {new}")
+
+    # Throughput: higher is better
+    for name, new in results["throughput"].items():
+        old = baseline.get("throughput", {}).get(name)
+        if old and new < old * (1 - tolerance):
+            regressions.append(f"{name}: {old} -> {new}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG backend benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Ingestion embedding cost on the bundled PDFs")
+    ingest_parser.add_argument("--pdfs", default="uploads", help="Folder to search for PDFs")
+    ingest_parser.add_argument("--repeat", type=int, default=3, help="Runs per variant (best time is kept)")
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    scheduler_parser = subparsers.add_parser("scheduler", help="LLM scheduler cap, priorities and coalescing with a stub model")
+    scheduler_parser.add_argument("--requests", type=int, default=40, help="Concurrent requests to send")
+    scheduler_parser.add_argument("--concurrency", type=int, default=2, help="Scheduler concurrency cap")
+    scheduler_parser.add_argument("--latency", type=float, default=0.2, help="Stub model seconds per call")
+    scheduler_parser.set_defaults(func=bench_scheduler)
+
+    passwords_parser = subparsers.add_parser("passwords", help="Sustained bcrypt logins/sec through the password hasher")
+    passwords_parser.add_argument("--seconds", type=float, default=10, help="How long to run")
+    passwords_parser.add_argument("--clients", type=int, default=16, help="Concurrent login threads")
+    passwords_parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    passwords_parser.set_defaults(func=bench_passwords)
+
+    ann_parser = subparsers.add_parser("ann", help="recall@k vs latency of approximate indexes against flat search")
+    ann_parser.add_argument("--subject", help="Vector store folder to benchmark (default: synthetic vectors)")
+    ann_parser.add_argument("--synthetic", type=int, default=100000, help="Number of synthetic vectors")
+    ann_parser.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension")
+    ann_parser.add_argument("--queries", type=int, default=500, help="Number of queries")
+    ann_parser.add_argument("--k", type=int, default=5, help="Neighbours per query")
+    ann_parser.set_defaults(func=bench_ann)
+
+    quantization_parser = subparsers.add_parser("quantization", help="float16 / int8 embedding memory and recall@k vs float32")
+    quantization_parser.add_argument("--subject", help="Vector store folder to benchmark (default: synthetic vectors)")
+    quantization_parser.add_argument("--synthetic", type=int, default=20000, help="Number of synthetic vectors")
+    quantization_parser.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension")
+    quantization_parser.add_argument("--queries", type=int, default=500, help="Number of queries")
+    quantization_parser.add_argument("--k", type=int, default=5, help="Neighbours per query")
+    quantization_parser.set_defaults(func=bench_quantization)
+
+    e2e_parser = subparsers.add_parser("e2e", help="End-to-end /chunk, /rag, /tsne and /generate_quiz with a stub LLM")
+    e2e_parser.add_argument("--pdfs", default="uploads", help="Folder to search for PDFs")
+    e2e_parser.add_argument("--scales", default="1,10", help="Corpus size multipliers for /rag and /tsne")
+    e2e_parser.add_argument("--queries", type=int, default=50, help="/rag queries per corpus size")
+    e2e_parser.add_argument("--repeat", type=int, default=5, help="Calls of /tsne and /generate_quiz")
+    e2e_parser.add_argument("--clients", type=int, default=8, help="Concurrent clients for /rag throughput")
+    e2e_parser.add_argument("--latency", type=float, default=0.05, help="Stub LLM seconds per call")
+    e2e_parser.add_argument("--baseline", default="benchmark_baseline.json", help="Baseline results to compare with")
+    e2e_parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a metric counts as a regression")
+    e2e_parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    e2e_parser.set_defaults(func=bench_e2e)
+
+    args = parser.parse_args()
+    args.func(args)
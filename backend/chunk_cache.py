@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from chunk_store import ChunkStore, save_chunks
+from config import CHUNK_CACHE_FOLDER, CHUNK_CACHE_MAX_BYTES
+
+
+def chunk_cache_key(sha256, chunk_size, chunk_overlap, model_name):
+    """Cache key for a PDF's chunks: its content hash plus everything that affects chunking and embedding."""
+    params = json.dumps([sha256, chunk_size, chunk_overlap, model_name])
+    return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+
+def _entry_bytes(entry_path):
+    return sum(os.path.getsize(os.path.join(entry_path, name)) for name in os.listdir(entry_path))
+
+
+class ChunkCache:
+    """
+    Content-addressed cache of chunk texts and embeddings, shared by all subjects and workers.
+    Embeddings are kept as float32 whatever EMBEDDING_QUANTIZATION is, so a hit returns the
+    same vectors as a fresh embedding; subjects quantize them when they save their own store.
+    Entries are evicted least recently used first once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, folder=CHUNK_CACHE_FOLDER, max_bytes=CHUNK_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, file_path):
+        """Return (chunks, embeddings) for a cache key, or None on a miss."""
+        entry_path = os.path.join(self.folder, key)
+        try:
+            store = ChunkStore(entry_path)
+            if store.quantization != "none":
+                raise ValueError("Quantized cache entry")  # Written by an older version
+            documents = store.documents()
+            embeddings = np.array(store.embeddings, dtype=np.float32)
+            os.utime(entry_path)  # Mark as recently used
+        except (OSError, ValueError):
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path, ignore_errors=True)  # Drop a damaged entry so it can be rewritten
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # The same PDF may be cached under another subject or file name
+        for document in documents:
+            document.id = None
+            document.metadata["source"] = file_path
+        with self._lock:
+            self.hits += 1
+        return documents, embeddings
+
+    def put(self, key, chunks, embeddings):
+        """Store a PDF's chunks and embeddings, then evict old entries if over the size cap."""
+        os.makedirs(self.folder, exist_ok=True)
+        entry_path = os.path.join(self.folder, key)
+        tmp_path = tempfile.mkdtemp(dir=self.folder, prefix=".tmp-")
+        save_chunks(
+            tmp_path,
+            [str(i) for i in range(len(chunks))],
+            [chunk.page_content for chunk in chunks],
+            [chunk.metadata for chunk in chunks],
+            embeddings,
+            quantization="none"
+        )
+        try:
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            # Another worker stored the same entry first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.folder):
+                entry_path = os.path.join(self.folder, name)
+                if name.startswith(".") or not os.path.isdir(entry_path):
+                    continue
+                entries.append((os.path.getmtime(entry_path), _entry_bytes(entry_path), entry_path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_path, ignore_errors=True)
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "folder": self.folder,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+chunk_cache = ChunkCache()
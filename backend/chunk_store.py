@@ -0,0 +1,235 @@
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+from embedding_registry import get_embedding_model
+from quantization import quantize, dequantize, quantization_of
+from config import STAMP_WAIT_SECONDS
+
+# Files written next to index.faiss in uploads/<subject>/vector_store
+EMBEDDINGS_FILE = "embeddings.npy"   # float32/float16/int8 matrix, one row per chunk (same order as the FAISS index)
+SCALE_FILE = "embeddings.scale.npy"  # float32 per-dimension scale of int8 embeddings
+CHUNKS_FILE = "chunks.jsonl"         # one JSON record per chunk: id, text, metadata
+OFFSETS_FILE = "chunks.idx.npy"      # int64 byte offsets of each record in chunks.jsonl
+
+# Version stamps: /chunk writes the same stamp next to the chunk store and the FAISS index,
+# so readers can tell that both belong to one save. "pending" marks files being replaced.
+STAMP_FILE = "chunks.stamp"
+INDEX_STAMP_FILE = "index.stamp"
+PENDING_STAMP = "pending"
+
+# Open chunk stores, keyed by vector store path
+_open_stores = {}
+_lock = threading.Lock()
+
+
+def new_stamp():
+    return uuid.uuid4().hex
+
+
+def write_stamp(vector_store_path, name, stamp):
+    """Atomically write a version stamp file."""
+    stamp_tmp = os.path.join(vector_store_path, name + ".tmp")
+    with open(stamp_tmp, "w", encoding="utf-8") as f:
+        f.write(stamp)
+    os.replace(stamp_tmp, os.path.join(vector_store_path, name))
+
+
+def read_stamp(vector_store_path, name):
+    """Return a version stamp, or None for stores saved without one."""
+    try:
+        with open(os.path.join(vector_store_path, name), encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def save_chunks(vector_store_path, ids, texts, metadatas, embeddings, quantization=None, stamp=None):
+    """
+    Persist chunk ids, texts, metadata and embeddings for a subject.
+    Embeddings are stored as float32 unless `quantization` (or EMBEDDING_QUANTIZATION)
+    is float16 or int8. Files are written to temporary names and renamed into place,
+    so readers in other workers never see a half-written store. `stamp` is the version
+    stamp shared with the index saved alongside (see vector_store_cache.save_index).
+    """
+    os.makedirs(vector_store_path, exist_ok=True)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if len(embeddings) != len(texts):
+        raise ValueError(f"Got {len(embeddings)} embeddings for {len(texts)} chunks")
+
+    offsets = [0]
+    chunks_tmp = os.path.join(vector_store_path, CHUNKS_FILE + ".tmp")
+    with open(chunks_tmp, "wb") as f:
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            record = json.dumps({"id": chunk_id, "text": text, "metadata": metadata}, default=str)
+            line = (record + "\n").encode("utf-8")
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+
+    offsets_tmp = os.path.join(vector_store_path, OFFSETS_FILE + ".tmp")
+    with open(offsets_tmp, "wb") as f:
+        np.save(f, np.asarray(offsets, dtype=np.int64))
+
+    codes, scale = quantize(embeddings, quantization)
+    embeddings_tmp = os.path.join(vector_store_path, EMBEDDINGS_FILE + ".tmp")
+    with open(embeddings_tmp, "wb") as f:
+        np.save(f, codes)
+    if scale is not None:
+        scale_tmp = os.path.join(vector_store_path, SCALE_FILE + ".tmp")
+        with open(scale_tmp, "wb") as f:
+            np.save(f, scale)
+        os.replace(scale_tmp, os.path.join(vector_store_path, SCALE_FILE))
+
+    # Readers wait while the stamp is pending; embeddings go last, their presence marks the store as complete
+    if stamp is not None:
+        write_stamp(vector_store_path, STAMP_FILE, PENDING_STAMP)
+    os.replace(chunks_tmp, os.path.join(vector_store_path, CHUNKS_FILE))
+    os.replace(offsets_tmp, os.path.join(vector_store_path, OFFSETS_FILE))
+    os.replace(embeddings_tmp, os.path.join(vector_store_path, EMBEDDINGS_FILE))
+    if scale is None and os.path.exists(os.path.join(vector_store_path, SCALE_FILE)):
+        os.remove(os.path.join(vector_store_path, SCALE_FILE))
+    if stamp is not None:
+        write_stamp(vector_store_path, STAMP_FILE, stamp)
+    elif os.path.exists(os.path.join(vector_store_path, STAMP_FILE)):
+        os.remove(os.path.join(vector_store_path, STAMP_FILE))
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a subject's persisted chunks.
+    `embeddings` is always float32: the memory-mapped file itself when stored at full
+    precision, otherwise decoded from the quantized codes on first use.
+    """
+
+    def __init__(self, vector_store_path, version=None):
+        self.path = vector_store_path
+        self.version = version
+        self.codes = np.load(os.path.join(vector_store_path, EMBEDDINGS_FILE), mmap_mode="r")
+        self.quantization = quantization_of(self.codes)
+        self._scale = np.load(os.path.join(vector_store_path, SCALE_FILE)) if self.quantization == "int8" else None
+        self._embeddings = self.codes if self.quantization == "none" else None
+        self._offsets = np.load(os.path.join(vector_store_path, OFFSETS_FILE))
+        with open(os.path.join(vector_store_path, CHUNKS_FILE), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if len(self._offsets) != len(self.codes) + 1:
+            raise ValueError(f"Chunk store at '{vector_store_path}' is inconsistent")
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = dequantize(self.codes, self._scale)
+        return self._embeddings
+
+    def embedding_bytes(self):
+        """Bytes taken by the stored embeddings (and their int8 scale)."""
+        return self.codes.nbytes + (self._scale.nbytes if self._scale is not None else 0)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def record(self, i):
+        """Return the stored record (id, text, metadata) of chunk i."""
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json.loads(self._data[start:end])
+
+    def text(self, i):
+        return self.record(i)["text"]
+
+    def texts(self):
+        return [self.text(i) for i in range(len(self))]
+
+    def documents(self):
+        """Return all chunks as LangChain documents, in index order."""
+        documents = []
+        for i in range(len(self)):
+            record = self.record(i)
+            documents.append(Document(id=record["id"], page_content=record["text"], metadata=record["metadata"]))
+        return documents
+
+
+def chunk_store_version(vector_store_path):
+    """
+    Return a version string for the persisted chunks, or None if they do not exist.
+    This is the stamp shared with the index, or file sizes and times for unstamped stores.
+    """
+    if not os.path.exists(os.path.join(vector_store_path, EMBEDDINGS_FILE)):
+        return None
+    stamp = read_stamp(vector_store_path, STAMP_FILE)
+    if stamp is not None:
+        return stamp
+    parts = []
+    for name in (EMBEDDINGS_FILE, CHUNKS_FILE, OFFSETS_FILE):
+        try:
+            stat = os.stat(os.path.join(vector_store_path, name))
+        except OSError:
+            return None
+        parts.append(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    return "-".join(parts)
+
+
+def rebuild_chunks_from_index(vector_store_path):
+    """
+    Recreate the chunk store of a subject from its saved FAISS index.
+    Vectors are reconstructed from the index, so nothing has to be re-embedded.
+    Used for vector stores created before chunks were persisted.
+    """
+    vector_store = FAISS.load_local(vector_store_path, get_embedding_model(), allow_dangerous_deserialization=True)
+    ntotal = vector_store.index.ntotal
+    embeddings = vector_store.index.reconstruct_n(0, ntotal) if ntotal else np.zeros((0, vector_store.index.d), dtype=np.float32)
+
+    ids, texts, metadatas = [], [], []
+    for i in range(ntotal):
+        doc_id = vector_store.index_to_docstore_id[i]
+        doc = vector_store.docstore.search(doc_id)
+        ids.append(doc_id)
+        texts.append(doc.page_content)
+        metadatas.append(doc.metadata)
+
+    save_chunks(vector_store_path, ids, texts, metadatas, embeddings, stamp=read_stamp(vector_store_path, INDEX_STAMP_FILE))
+
+
+def open_chunks(vector_store_path):
+    """
+    Return the ChunkStore for a vector store path, or None if the subject has no vector store.
+    Open stores are shared by all request threads and reopened when /chunk rewrites them.
+    A store that is being rewritten is waited for, up to STAMP_WAIT_SECONDS.
+    """
+    deadline = time.monotonic() + STAMP_WAIT_SECONDS
+    while True:
+        version = chunk_store_version(vector_store_path)
+        if version is None:
+            if not os.path.exists(os.path.join(vector_store_path, "index.faiss")):
+                return None
+            with _lock:
+                # Re-check under the lock in case another thread already rebuilt it
+                if chunk_store_version(vector_store_path) is None:
+                    rebuild_chunks_from_index(vector_store_path)
+            version = chunk_store_version(vector_store_path)
+
+        waiting = time.monotonic() < deadline
+        if version == PENDING_STAMP and waiting:
+            time.sleep(0.02)
+            continue
+
+        try:
+            with _lock:
+                entry = _open_stores.get(vector_store_path)
+                if entry is None or entry[0] != version:
+                    entry = (version, ChunkStore(vector_store_path, version))
+                    _open_stores[vector_store_path] = entry
+        except (OSError, ValueError):
+            # Files were replaced while opening them
+            if not waiting:
+                raise
+            time.sleep(0.02)
+            continue
+
+        # Nothing was replaced while the store was opened
+        if chunk_store_version(vector_store_path) == version or not waiting:
+            return entry[1]
@@ -0,0 +1,106 @@
+"""
+Settings of the RAG service and the backend, read once from environment variables.
+Every setting has the default shown here; set the variable of the same name to override it
+(EMBEDDING_MODEL sets EMBEDDING_MODEL_NAME). Modules import the settings they use from here.
+"""
+import os
+
+
+def _int(name, default):
+    return int(os.environ.get(name, str(default)))
+
+
+def _float(name, default):
+    return float(os.environ.get(name, str(default)))
+
+
+def _flag(name):
+    return os.environ.get(name, "0") == "1"
+
+
+# Embedding model (embedding_registry); EMBEDDING_PRELOAD=1 loads it at import time, e.g. in each gunicorn worker
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_DEVICE = os.environ.get("EMBEDDING_DEVICE", "cpu")
+EMBEDDING_BATCH_SIZE = _int("EMBEDDING_BATCH_SIZE", 64)
+EMBEDDING_PRELOAD = _flag("EMBEDDING_PRELOAD")
+
+# Embedding precision for the chunk store and the FAISS index: none (float32), float16 or int8 (quantization)
+EMBEDDING_QUANTIZATION = os.environ.get("EMBEDDING_QUANTIZATION", "none")
+
+# Index type for subject vector stores: auto, flat, ivf_flat, hnsw or ivf_pq (ann_index)
+ANN_INDEX_TYPE = os.environ.get("ANN_INDEX_TYPE", "auto")
+# Chunk counts at which "auto" switches index type
+ANN_FLAT_MAX = _int("ANN_FLAT_MAX", 20000)
+ANN_HNSW_MAX = _int("ANN_HNSW_MAX", 1000000)
+# Build and search parameters; 0 means "derive from the corpus size / dimension"
+ANN_NLIST = _int("ANN_NLIST", 0)
+ANN_NPROBE = _int("ANN_NPROBE", 16)
+ANN_HNSW_M = _int("ANN_HNSW_M", 32)
+ANN_EF_CONSTRUCTION = _int("ANN_EF_CONSTRUCTION", 80)
+ANN_EF_SEARCH = _int("ANN_EF_SEARCH", 64)
+ANN_PQ_M = _int("ANN_PQ_M", 0)
+
+# Processes used to parse and split PDFs; 1 parses on the calling thread (ingestion)
+INGEST_PROCESSES = _int("INGEST_PROCESSES", min(4, os.cpu_count() or 1))
+# Background /chunk and /delete jobs (ingest_jobs)
+INGEST_JOB_WORKERS = _int("INGEST_JOB_WORKERS", 2)
+INGEST_JOB_HISTORY = _int("INGEST_JOB_HISTORY", 200)
+
+# On-disk cache of parsed chunks and their embeddings (chunk_cache)
+CHUNK_CACHE_FOLDER = os.environ.get("CHUNK_CACHE_FOLDER", "cache/chunks")
+CHUNK_CACHE_MAX_BYTES = _int("CHUNK_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+
+# How long readers wait for an index save in progress to finish (chunk_store)
+STAMP_WAIT_SECONDS = _float("STAMP_WAIT_SECONDS", 5)
+
+# Loaded vector stores kept in memory (vector_store_cache)
+VECTOR_CACHE_MAX_SUBJECTS = _int("VECTOR_CACHE_MAX_SUBJECTS", 16)
+VECTOR_CACHE_MAX_BYTES = _int("VECTOR_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+
+# Semantic answer cache (answer_cache)
+ANSWER_CACHE_THRESHOLD = _float("ANSWER_CACHE_THRESHOLD", 0.95)
+ANSWER_CACHE_TTL = _float("ANSWER_CACHE_TTL", 3600)
+ANSWER_CACHE_MAX_ENTRIES = _int("ANSWER_CACHE_MAX_ENTRIES", 5000)
+
+# LLM dispatch (llm_scheduler)
+LLM_CONCURRENCY = _int("LLM_CONCURRENCY", 2)
+LLM_TIMEOUT = _float("LLM_TIMEOUT", 120)
+LLM_MAX_QUEUE = _int("LLM_MAX_QUEUE", 256)
+
+# Pre-generated quiz pool (quiz_pool)
+QUIZ_POOL_TARGET = _int("QUIZ_POOL_TARGET", 100)
+QUIZ_POOL_LOW_WATER = _int("QUIZ_POOL_LOW_WATER", 30)
+QUIZ_POOL_QUESTIONS_PER_CHUNK = _int("QUIZ_POOL_QUESTIONS_PER_CHUNK", 3)
+QUIZ_POOL_MAX_FAILURES = _int("QUIZ_POOL_MAX_FAILURES", 5)
+# On-demand quiz generation
+QUIZ_MAP_CONCURRENCY = _int("QUIZ_MAP_CONCURRENCY", 4)
+QUIZ_RETRIES = _int("QUIZ_RETRIES", 2)
+QUIZ_MAX_QUESTIONS = _int("QUIZ_MAX_QUESTIONS", 50)
+
+# /rag/batch limits and cross-subject /rag search threads (rag_pipeline)
+RAG_BATCH_MAX_QUERIES = _int("RAG_BATCH_MAX_QUERIES", 500)
+RAG_BATCH_CONCURRENCY = _int("RAG_BATCH_CONCURRENCY", 4)
+FEDERATED_SEARCH_WORKERS = _int("FEDERATED_SEARCH_WORKERS", 8)
+# Add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = _flag("SERVER_TIMING")
+
+# Uploads (upload_store): per-file and per-request limits, read block size and accepted extensions
+UPLOAD_MAX_BYTES = _int("UPLOAD_MAX_BYTES", 100 * 1024 * 1024)
+UPLOAD_MAX_REQUEST_BYTES = _int("UPLOAD_MAX_REQUEST_BYTES", 500 * 1024 * 1024)
+UPLOAD_BLOCK_SIZE = _int("UPLOAD_BLOCK_SIZE", 1024 * 1024)
+UPLOAD_EXTENSIONS = tuple(os.environ.get("UPLOAD_EXTENSIONS", ".pdf").split(","))
+# Uploads are written here first and renamed into place; it must be on the same filesystem as uploads/
+UPLOAD_TMP_FOLDER = os.environ.get("UPLOAD_TMP_FOLDER", os.path.join("uploads", ".incoming"))
+
+# MySQL connection pool (db_pool)
+DB_POOL_MIN_SIZE = _int("DB_POOL_MIN_SIZE", 2)
+DB_POOL_MAX_SIZE = _int("DB_POOL_MAX_SIZE", 20)
+DB_POOL_TIMEOUT = _float("DB_POOL_TIMEOUT", 10)
+DB_POOL_IDLE_TIMEOUT = _float("DB_POOL_IDLE_TIMEOUT", 300)
+DB_POOL_HEALTH_CHECK_AFTER = _float("DB_POOL_HEALTH_CHECK_AFTER", 5)
+
+# Password hashing (passwords)
+BCRYPT_ROUNDS = _int("BCRYPT_ROUNDS", 12)
+PASSWORD_HASH_WORKERS = _int("PASSWORD_HASH_WORKERS", os.cpu_count() or 2)
+PASSWORD_HASH_MAX_PENDING = _int("PASSWORD_HASH_MAX_PENDING", 4 * PASSWORD_HASH_WORKERS)
+PASSWORD_HASH_TIMEOUT = _float("PASSWORD_HASH_TIMEOUT", 10)
@@ -0,0 +1,219 @@
+import threading
+import time
+import weakref
+from collections import deque
+from metrics import Histogram
+from config import DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_IDLE_TIMEOUT, DB_POOL_HEALTH_CHECK_AFTER
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no connection became free within the pool timeout."""
+
+
+class PooledConnection:
+    """
+    A checked-out connection. It behaves like the underlying connection, except that
+    close() (or leaving a `with` block) hands it back to the pool instead of closing
+    the socket. A wrapper that is garbage-collected without close() returns its
+    connection too, so a missed close() cannot leak a pool slot for good.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self._finalizer = weakref.finalize(self, pool.reclaim, connection)
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise RuntimeError("Connection was already returned to the pool")
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._finalizer.detach()
+            self._pool.release(connection)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections created with `connect()`.
+    Keeps at least `min_size` connections open and never more than `max_size`.
+    Connections idle longer than `health_check_after` seconds are pinged on checkout,
+    and connections above `min_size` idle longer than `idle_timeout` are closed.
+    """
+
+    def __init__(self, connect, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT,
+                 idle_timeout=DB_POOL_IDLE_TIMEOUT, health_check_after=DB_POOL_HEALTH_CHECK_AFTER):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._idle = deque()  # (connection, returned_at), most recently returned last
+        self._size = 0        # Open connections, idle or checked out
+        self._cond = threading.Condition()
+        self._reaper = None
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.created = 0
+        self.closed = 0
+        self.reaped = 0
+        self.health_check_failures = 0
+        self.reclaimed = 0
+        self.wait_seconds = Histogram("db_pool_wait_seconds", "Time spent waiting for a free database connection")
+
+    def get(self):
+        """Check out a healthy connection, opening one if the pool is below max_size."""
+        start = time.perf_counter()
+        waited = False
+        self._start_reaper()
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    waited = True
+                    remaining = self.timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"No database connection free after {self.timeout:g}s")
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                else:
+                    connection, returned_at = None, None
+                    self._size += 1  # Reserve a slot before connecting outside the lock
+
+            if connection is None:
+                try:
+                    connection = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif time.monotonic() - returned_at > self.health_check_after and not self._healthy(connection):
+                self._discard(connection)
+                with self._cond:
+                    self.health_check_failures += 1
+                continue
+
+            with self._cond:
+                self.checkouts += 1
+                if waited:
+                    self.waits += 1
+            self.wait_seconds.observe(time.perf_counter() - start)
+            return PooledConnection(self, connection)
+
+    def release(self, connection):
+        """Return a connection to the pool, ending any open transaction."""
+        try:
+            connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def reclaim(self, connection):
+        """Return a connection whose wrapper was dropped without close()."""
+        with self._cond:
+            self.reclaimed += 1
+        self.release(connection)
+
+    def _open(self):
+        connection = self.connect()
+        with self._cond:
+            self.created += 1
+        return connection
+
+    def _healthy(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.closed += 1
+            self._cond.notify()
+
+    def fill(self):
+        """Open connections until min_size are available."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((connection, time.monotonic()))
+                self._cond.notify()
+
+    def reap(self):
+        """Close connections above min_size that have been idle longer than idle_timeout."""
+        expired = []
+        now = time.monotonic()
+        with self._cond:
+            # Oldest returned first
+            while self._idle and self._size - len(expired) > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+        for connection in expired:
+            self._discard(connection)
+        with self._cond:
+            self.reaped += len(expired)
+
+    def _start_reaper(self):
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name="db-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(max(1.0, self.idle_timeout / 4))
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"Database pool reaper failed: {e}")
+
+    def stats(self):
+        with self._cond:
+            counters = {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "created": self.created,
+                "closed": self.closed,
+                "reaped": self.reaped,
+                "health_check_failures": self.health_check_failures,
+                "reclaimed": self.reclaimed,
+            }
+        counters["wait_seconds"] = self.wait_seconds.snapshot()
+        return counters
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from langchain_huggingface import HuggingFaceEmbeddings
+from metrics import record_stage
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_DEVICE, EMBEDDING_BATCH_SIZE, EMBEDDING_PRELOAD
+
+# Loaded models and their load statistics, keyed by (model name, device, batch size)
+_models = {}
+_model_stats = {}
+_lock = threading.Lock()
+
+
+def current_rss_bytes():
+    """Return the resident set size of this process in bytes (0 if unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _parameter_bytes(model):
+    """Size of the underlying SentenceTransformer weights in bytes."""
+    client = getattr(model, "_client", None)
+    if client is None or not hasattr(client, "parameters"):
+        return 0
+    return sum(p.numel() * p.element_size() for p in client.parameters())
+
+
+def get_embedding_model(model_name=None, device=None, batch_size=None):
+    """
+    Return the shared embedding model, loading it on first use.
+    The model is loaded once per process and reused by every request thread.
+    """
+    model_name = model_name or EMBEDDING_MODEL_NAME
+    device = device or EMBEDDING_DEVICE
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    key = (model_name, device, batch_size)
+
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another thread may have finished loading while we waited for the lock
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        model = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": device},
+            encode_kwargs={"batch_size": batch_size},
+        )
+        load_seconds = time.perf_counter() - start
+        record_stage("load_embedding_model", load_seconds)
+
+        _model_stats[key] = {
+            "model_name": model_name,
+            "device": device,
+            "batch_size": batch_size,
+            "load_seconds": round(load_seconds, 3),
+            "parameter_bytes": _parameter_bytes(model),
+            "rss_delta_bytes": max(current_rss_bytes() - rss_before, 0),
+        }
+        _models[key] = model
+        print(f"Loaded embedding model '{model_name}' on {device} in {load_seconds:.2f}s")
+        return model
+
+
+def embedding_model_stats():
+    """Return load time and memory statistics for every loaded embedding model."""
+    return list(_model_stats.values())
+
+
+# Load the default model at import time when EMBEDDING_PRELOAD=1 (e.g. in each gunicorn worker)
+if EMBEDDING_PRELOAD:
+    get_embedding_model()
@@ -1,7 +1,10 @@
 from flask import Flask, request, jsonify
 import os
 from flask_cors import CORS
+from upload_store import UploadRequest, store_upload, UPLOAD_MAX_REQUEST_BYTES
 app = Flask(__name__)
+app.request_class = UploadRequest  # Stream uploaded files to disk while hashing them
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_REQUEST_BYTES
 CORS(app)
 
 # Define the directory to save uploaded files
@@ -19,13 +22,12 @@ def upload_file():
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
-    # Save the file to the uploads directory
-    file_path = os.path.join(UPLOAD_FOLDER, "hello "+file.filename)
-    print(file_path)
-    file.save(file_path)
+    # Move the streamed file into the uploads directory (or reuse an identical upload)
+    stored = store_upload(file, UPLOAD_FOLDER, "hello " + os.path.basename(file.filename), replace=True)
+    print(stored["filePath"])
 
     # Return the file path
-    return jsonify({"message": "File uploaded successfully", "filePath": file_path}), 200
+    return jsonify({"message": "File uploaded successfully", **stored}), 200
 
 
 if __name__ == '__main__':
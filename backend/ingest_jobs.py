@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from config import INGEST_JOB_WORKERS, INGEST_JOB_HISTORY
+
+
+class IngestJob:
+    """State and progress of one /chunk or /delete request."""
+
+    def __init__(self, subject, file_paths=None, remove_paths=()):
+        self.id = uuid.uuid4().hex
+        self.subject = subject
+        self.file_paths = file_paths            # None keeps the files already indexed
+        self.remove_paths = list(remove_paths)  # Deleted files, dropped from the list above
+        self.status = "queued"      # queued -> running -> done | failed
+        self.stage = "queued"
+        self.percent = 0.0
+        self.chunks = 0
+        self.error = None
+        self.result = None
+        self.submissions = 1        # /chunk calls coalesced into this job
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def update(self, stage, percent, chunks=None):
+        """Progress callback passed to the ingestion pipeline."""
+        self.stage = stage
+        self.percent = round(float(percent), 1)
+        if chunks is not None:
+            self.chunks = chunks
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "jobId": self.id,
+            "subject": self.subject,
+            "status": self.status,
+            "stage": self.stage,
+            "percent": self.percent,
+            "chunks": self.chunks,
+            "chunksPerSec": round(self.chunks / elapsed, 1) if elapsed > 0 else 0.0,
+            "elapsedSec": round(elapsed, 2),
+            "queuedSec": round((self.started_at or end) - self.created_at, 2),
+            "submissions": self.submissions,
+            "error": self.error,
+            "result": self.result,
+        }
+
+
+class IngestJobQueue:
+    """
+    In-process job queue with a pool of worker threads; no external broker is needed.
+    A subject has at most one queued job: resubmitting while it waits updates that job
+    instead of adding another one. Only one job per subject runs at a time; a job submitted
+    while its subject is running is held back (and keeps coalescing) until that job ends,
+    so it never occupies a worker that other subjects could use.
+    """
+
+    def __init__(self, handler, workers=INGEST_JOB_WORKERS, history=INGEST_JOB_HISTORY):
+        self.handler = handler
+        self.workers = workers
+        self.history = history
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._pending = {}          # subject -> queued (not yet running) job
+        self._running = set()       # subjects with a running job
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, subject, file_paths=None, remove_paths=()):
+        """
+        Queue an ingestion job for a subject and return it. `file_paths` is the subject's
+        full file list (/chunk); `remove_paths` are files to drop from the index (/delete).
+        """
+        with self._lock:
+            self._start_workers()
+            job = self._pending.get(subject)
+            if job is not None:
+                # Coalesce: a new file list replaces the queued one and any deletions before it
+                if file_paths is not None:
+                    job.file_paths = file_paths
+                    job.remove_paths = []
+                job.remove_paths.extend(remove_paths)
+                job.submissions += 1
+                return job
+
+            job = IngestJob(subject, file_paths, remove_paths)
+            self._jobs[job.id] = job
+            self._pending[subject] = job
+            self._forget_old_jobs()
+            if subject in self._running:
+                return job  # Queued once the running job for this subject finishes
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            by_status = {}
+            for job in self._jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+            return {
+                "workers": self.workers,
+                "queued": len(self._pending),
+                "running_subjects": len(self._running),
+                "jobs": by_status,
+            }
+
+    def _start_workers(self):
+        # Threads are started on first use so importing the module has no side effects
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"ingest-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(len(finished) - self.history, 0)]:
+            del self._jobs[job.id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if self._pending.get(job.subject) is job:
+                    del self._pending[job.subject]
+                self._running.add(job.subject)
+                job.status = "running"
+                job.started_at = time.time()
+
+            try:
+                job.result = self.handler(job)
+                job.status = "done"
+                job.update("done", 100)
+            except Exception as e:
+                traceback.print_exc()
+                job.status = "failed"
+                job.stage = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self._running.discard(job.subject)
+                    held = self._pending.get(job.subject)
+                if held is not None:
+                    self._queue.put(held)
+                self._queue.task_done()
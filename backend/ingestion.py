@@ -0,0 +1,367 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from embedding_registry import get_embedding_model, EMBEDDING_MODEL_NAME
+from chunk_store import save_chunks, open_chunks, new_stamp
+from ann_index import build_index, index_type_of, index_matches
+from chunk_cache import chunk_cache, chunk_cache_key
+from vector_store_cache import load_vector_store, save_index
+from pdf_parser import load_and_split, CHUNK_SIZE, CHUNK_OVERLAP
+from config import INGEST_PROCESSES
+
+# Texts embedded per call when progress is being reported
+EMBED_PROGRESS_BATCH = 512
+
+# Per-document manifest saved next to the index: file key -> path, sha256 and chunk ids
+MANIFEST_FILE = "documents.json"
+
+# One index update at a time per subject
+_subject_locks = {}
+_subject_locks_guard = threading.Lock()
+
+# Shared parser process pool, created on first use
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def _report(progress, stage, percent, **info):
+    """Forward a progress update to the caller's callback, if any."""
+    if progress is not None:
+        progress(stage, percent, **info)
+
+
+def _get_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # Spawn rather than fork: the parent may hold torch/FAISS threads that do not survive a fork.
+            # Spawned workers re-import the main module, so start the server with server.py
+            _parse_pool = ProcessPoolExecutor(max_workers=INGEST_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _parse_pool
+
+
+def parse_files(file_paths):
+    """
+    Parse and split PDFs across the parser process pool.
+    Results come back in the order of `file_paths`, so chunk ids stay stable.
+    """
+    global _parse_pool
+    if INGEST_PROCESSES <= 1 or len(file_paths) <= 1:
+        return [load_and_split(file_path) for file_path in file_paths]
+    try:
+        return list(_get_parse_pool().map(load_and_split, file_paths))
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool next time and parse inline now
+        with _parse_pool_lock:
+            _parse_pool = None
+        return [load_and_split(file_path) for file_path in file_paths]
+
+
+def embed_texts(texts, embedding_model=None, progress=None):
+    """
+    Embed chunk texts in a single batched pass.
+    Returns a float32 matrix with one row per text.
+    With a progress callback, texts are embedded in slices and progress(done, total) is called after each.
+    """
+    embedding_model = embedding_model or get_embedding_model()
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    if progress is None:
+        return np.asarray(embedding_model.embed_documents(texts), dtype=np.float32)
+
+    parts = []
+    for start in range(0, len(texts), EMBED_PROGRESS_BATCH):
+        parts.append(np.asarray(embedding_model.embed_documents(texts[start:start + EMBED_PROGRESS_BATCH]), dtype=np.float32))
+        progress(min(start + EMBED_PROGRESS_BATCH, len(texts)), len(texts))
+    return np.vstack(parts)
+
+
+def build_vector_store(chunks, embeddings, embedding_model=None, ids=None):
+    """Build a FAISS vector store from chunks and their precomputed embeddings."""
+    embedding_model = embedding_model or get_embedding_model()
+    texts = [chunk.page_content for chunk in chunks]
+    return FAISS.from_embeddings(
+        zip(texts, embeddings),
+        embedding_model,
+        metadatas=[chunk.metadata for chunk in chunks],
+        ids=ids
+    )
+
+
+def chunk_and_embed(files, embedding_model=None, timings=None, progress=None):
+    """
+    Return (chunks, embeddings) for each (file_path, sha256) in `files`, in order.
+    Files already in the chunk cache are neither parsed nor embedded; the rest are
+    parsed in parallel and then embedded together in one batch.
+    Stage durations are added to `timings` if given.
+    """
+    embedding_model = embedding_model or get_embedding_model()
+    timings = timings if timings is not None else {}
+
+    start = time.perf_counter()
+    results = []
+    missing = []
+    for i, (file_path, sha256) in enumerate(files):
+        key = chunk_cache_key(sha256, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL_NAME)
+        cached = chunk_cache.get(key, file_path)
+        results.append(cached)
+        if cached is None:
+            missing.append((i, key))
+    timings["cache_lookup"] = time.perf_counter() - start
+
+    _report(progress, "parsing", 10)
+    start = time.perf_counter()
+    parsed = parse_files([files[i][0] for i, _ in missing])
+    for (i, _), chunks in zip(missing, parsed):
+        results[i] = (chunks, None)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    texts = [chunk.page_content for i, _ in missing for chunk in results[i][0]]
+    _report(progress, "embedding", 40, chunks=0)
+    embed_progress = None
+    if progress is not None:
+        embed_progress = lambda done, total: progress("embedding", 40 + 45 * done / total, chunks=done)
+    embeddings = embed_texts(texts, embedding_model, embed_progress)
+    timings["embed"] = time.perf_counter() - start
+
+    offset = 0
+    for i, key in missing:
+        chunks = results[i][0]
+        file_embeddings = embeddings[offset:offset + len(chunks)]
+        offset += len(chunks)
+        results[i] = (chunks, file_embeddings)
+        chunk_cache.put(key, chunks, file_embeddings)
+    return results
+
+
+def file_sha256(file_path):
+    """Hash a file in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_key(file_path):
+    """Normalise a file path so relative and absolute paths to one PDF share a manifest entry."""
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+def chunk_ids_for(key, sha256, count):
+    """Deterministic chunk ids for a document, stable across re-chunking."""
+    prefix = hashlib.sha256(f"{key}\0{sha256}".encode("utf-8")).hexdigest()[:16]
+    return [f"{prefix}-{i}" for i in range(count)]
+
+
+def load_manifest(vector_store_path):
+    """
+    Return the per-document manifest of a vector store ({} if there is no index).
+    Stores saved before the manifest existed are attributed to files by each chunk's source metadata.
+    """
+    manifest_file = os.path.join(vector_store_path, MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        with open(manifest_file, encoding="utf-8") as f:
+            return json.load(f)
+
+    chunks = open_chunks(vector_store_path)
+    if chunks is None:
+        return {}
+    documents = {}
+    for i in range(len(chunks)):
+        record = chunks.record(i)
+        source = record["metadata"].get("source", "")
+        key = document_key(source)
+        # Unknown hash: the file is re-indexed the next time it is chunked
+        documents.setdefault(key, {"path": source, "sha256": None, "ids": []})["ids"].append(record["id"])
+    return documents
+
+
+def save_manifest(vector_store_path, documents):
+    manifest_tmp = os.path.join(vector_store_path, MANIFEST_FILE + ".tmp")
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump(documents, f)
+    os.replace(manifest_tmp, os.path.join(vector_store_path, MANIFEST_FILE))
+
+
+def _subject_lock(vector_store_path):
+    with _subject_locks_guard:
+        return _subject_locks.setdefault(document_key(vector_store_path), threading.Lock())
+
+
+def _remove_vectors(vector_store, kept_positions, kept_embeddings):
+    """
+    Drop every vector not at `kept_positions` from a vector store, keeping positions contiguous
+    and in chunk store order. Flat indexes remove the rows in place; IVF indexes are emptied and
+    refilled with the kept vectors, reusing their trained centroids (FAISS would keep the removed
+    positions as gaps). HNSW cannot remove vectors: it is swapped for a flat copy of the kept
+    vectors and False is returned, so the caller rebuilds it.
+    """
+    index = vector_store.index
+    kept = set(kept_positions)
+    removed_positions = [i for i in range(index.ntotal) if i not in kept]
+    vector_store.docstore.delete([vector_store.index_to_docstore_id[i] for i in removed_positions])
+    vector_store.index_to_docstore_id = {
+        position: vector_store.index_to_docstore_id[old] for position, old in enumerate(kept_positions)
+    }
+
+    index_type = index_type_of(index)
+    if index_type == "flat":
+        index.remove_ids(np.asarray(removed_positions, dtype=np.int64))
+        return True
+    if index_type in ("ivf_flat", "ivf_pq"):
+        index.reset()
+        if len(kept_embeddings):
+            index.add(kept_embeddings)
+        return True
+    vector_store.index = build_index(kept_embeddings, "flat", quantization="none")
+    return False
+
+
+def _apply_changes(vector_store_path, documents, remove_keys, add_files, timings, progress=None):
+    """
+    Remove the chunks of `remove_keys` and append chunks for `add_files` ({key: (path, sha256)}).
+    Only the added files are parsed and embedded; kept vectors are copied from the chunk store.
+    The index is updated in place and only rebuilt when the corpus size calls for another
+    index type, or when vectors must be removed from an index that cannot remove them.
+    Returns the updated vector store, or None if the subject has no chunks left.
+    """
+    _report(progress, "removing", 5)
+    start = time.perf_counter()
+    chunks = open_chunks(vector_store_path)
+    vector_store = load_vector_store(vector_store_path) if chunks is not None else None
+
+    # Drop removed documents from the index, keeping the chunk store rows in index order
+    kept_embeddings = np.zeros((0, 0), dtype=np.float32)
+    remove_set = {chunk_id for key in remove_keys for chunk_id in documents[key]["ids"]}
+    rebuild = vector_store is None
+    if vector_store is not None:
+        kept_positions = [i for i in range(vector_store.index.ntotal) if vector_store.index_to_docstore_id[i] not in remove_set]
+        kept_embeddings = np.asarray(chunks.embeddings[kept_positions], dtype=np.float32)
+        if len(kept_positions) < vector_store.index.ntotal:
+            rebuild = not _remove_vectors(vector_store, kept_positions, kept_embeddings)
+    for key in remove_keys:
+        del documents[key]
+    timings["remove"] = time.perf_counter() - start
+
+    # Parse and embed only the new or changed files (or reuse their cached chunks)
+    embedding_model = get_embedding_model()
+    new_chunks, new_ids, embedding_parts = [], [], []
+    results = chunk_and_embed(list(add_files.values()), embedding_model, timings, progress)
+    for (key, (file_path, sha256)), (file_chunks, file_embeddings) in zip(add_files.items(), results):
+        ids = chunk_ids_for(key, sha256, len(file_chunks))
+        new_chunks.extend(file_chunks)
+        new_ids.extend(ids)
+        if len(file_chunks):
+            embedding_parts.append(file_embeddings)
+        documents[key] = {"path": file_path, "sha256": sha256, "ids": ids}
+
+    new_embeddings = np.vstack(embedding_parts) if embedding_parts else np.zeros((0, 0), dtype=np.float32)
+    _report(progress, "indexing", 85, chunks=len(new_chunks))
+    start = time.perf_counter()
+    if new_chunks:
+        if vector_store is None or vector_store.index.ntotal == 0:
+            vector_store = build_vector_store(new_chunks, new_embeddings, embedding_model, ids=new_ids)
+            rebuild = True
+        else:
+            vector_store.add_embeddings(
+                zip([chunk.page_content for chunk in new_chunks], new_embeddings),
+                metadatas=[chunk.metadata for chunk in new_chunks],
+                ids=new_ids
+            )
+
+    if vector_store is None or vector_store.index.ntotal == 0:
+        shutil.rmtree(vector_store_path, ignore_errors=True)
+        timings["index"] = time.perf_counter() - start
+        return None
+
+    # Rebuild only if the corpus size now calls for another index type (flat for small subjects)
+    embeddings = np.vstack([matrix for matrix in (kept_embeddings, new_embeddings) if len(matrix)])
+    if rebuild or not index_matches(vector_store.index, len(embeddings)):
+        vector_store.index = build_index(embeddings)
+    timings["index"] = time.perf_counter() - start
+
+    _report(progress, "saving", 95)
+    start = time.perf_counter()
+
+    # Persist chunks, index and manifest; the chunk store mirrors the index order and both get the same stamp
+    ids = [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
+    docs = [vector_store.docstore.search(doc_id) for doc_id in ids]
+    stamp = new_stamp()
+    save_chunks(
+        vector_store_path,
+        ids,
+        [doc.page_content for doc in docs],
+        [doc.metadata for doc in docs],
+        embeddings,
+        stamp=stamp
+    )
+    save_index(vector_store, vector_store_path, stamp)
+    save_manifest(vector_store_path, documents)
+    timings["save"] = time.perf_counter() - start
+    return vector_store
+
+
+def update_subject_index(file_paths, vector_store_path, progress=None, remove_paths=()):
+    """
+    Bring a subject's vector store in line with the given PDFs.
+    New or modified files are appended, files no longer listed are removed and
+    unchanged files are left alone. With file_paths=None the files already indexed
+    (and still on disk) are kept; `remove_paths` are dropped from either list.
+    Returns (vector_store, summary); vector_store is None when nothing changed or when
+    no chunks are left.
+    `progress(stage, percent, chunks=...)` is called as the update moves through its stages.
+    """
+    with _subject_lock(vector_store_path):
+        _report(progress, "hashing", 0)
+        timings = {}
+        start = time.perf_counter()
+        documents = load_manifest(vector_store_path)
+        if file_paths is None:
+            file_paths = [document["path"] for document in documents.values() if os.path.exists(document["path"])]
+        removed = {document_key(file_path) for file_path in remove_paths}
+
+        requested = {}
+        for file_path in file_paths:
+            if document_key(file_path) not in removed:
+                requested[document_key(file_path)] = (file_path, file_sha256(file_path))
+        timings["hash"] = time.perf_counter() - start
+
+        unchanged = [key for key, (_, sha256) in requested.items() if key in documents and documents[key]["sha256"] == sha256]
+        remove_keys = [key for key in documents if key not in unchanged]
+        add_files = {key: value for key, value in requested.items() if key not in unchanged}
+
+        summary = {
+            "added": [path for path, _ in add_files.values()],
+            "removed": [documents[key]["path"] for key in remove_keys if key not in requested],
+            "unchanged": [requested[key][0] for key in unchanged],
+            "changed": bool(remove_keys or add_files),
+            "timings": timings,
+        }
+        if summary["changed"]:
+            vector_store = _apply_changes(vector_store_path, documents, remove_keys, add_files, timings, progress)
+            summary["chunks"] = vector_store.index.ntotal if vector_store is not None else 0
+        else:
+            vector_store = None
+
+        # Report stage durations in milliseconds
+        summary["timings"] = {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+        return vector_store, summary
+
+
+def remove_document(file_path, vector_store_path):
+    """
+    Remove one PDF's chunks from a subject's vector store.
+    Returns (vector_store, removed); vector_store is None when no chunks are left.
+    """
+    vector_store, summary = update_subject_index(None, vector_store_path, remove_paths=[file_path])
+    return vector_store, document_key(file_path) in {document_key(path) for path in summary["removed"]}
@@ -0,0 +1,216 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from metrics import Histogram
+from config import LLM_CONCURRENCY, LLM_TIMEOUT, LLM_MAX_QUEUE
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0   # /rag, /rag/stream
+PRIORITY_QUIZ = 3          # Questions /generate_quiz has to generate on demand
+PRIORITY_BATCH = 5         # /rag/batch
+PRIORITY_BACKGROUND = 10   # Quiz pool fills and other background generation
+
+# Marks the end of a streamed generation
+_END = object()
+
+
+class SchedulerQueueFull(RuntimeError):
+    """Raised when too many LLM requests are already waiting."""
+
+
+class LLMScheduler:
+    """
+    Dispatches LLM calls to a fixed number of worker threads, so the model server
+    never runs more than `concurrency` generations at once. Waiting requests are
+    served by priority, then in arrival order. Identical prompts for the same LLM
+    that are queued or running are coalesced into one generation.
+    """
+
+    def __init__(self, concurrency=LLM_CONCURRENCY, timeout=LLM_TIMEOUT, max_queue=LLM_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self._heap = []          # (priority, sequence, entry)
+        self._sequence = itertools.count()
+        self._inflight = {}      # coalescing key -> entry
+        self._entries = {}       # future -> entry
+        self._cond = threading.Condition()
+        self._threads = []
+        self.running = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.wait_seconds = Histogram("llm_queue_wait_seconds", "Time LLM requests wait for a free slot")
+        self.run_seconds = Histogram("llm_generation_seconds", "Time LLM requests spend generating")
+
+    def submit(self, fn, *args, key=None, priority=PRIORITY_INTERACTIVE):
+        """
+        Queue fn(*args) and return a Future for its result. Requests with the same
+        `key` share the queued or running call instead of starting a new one.
+        """
+        with self._cond:
+            if key is not None and key in self._inflight:
+                entry = self._inflight[key]
+                entry["waiters"] += 1
+                self.coalesced += 1
+                return entry["future"]
+
+            if len(self._heap) >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerQueueFull(f"LLM queue is full ({self.max_queue} requests waiting)")
+
+            entry = {
+                "fn": fn,
+                "args": args,
+                "key": key,
+                "priority": priority,
+                "future": Future(),
+                "waiters": 1,
+                "queued_at": time.perf_counter(),
+            }
+            if key is not None:
+                self._inflight[key] = entry
+            self._entries[entry["future"]] = entry
+            heapq.heappush(self._heap, (priority, next(self._sequence), entry))
+            self.submitted += 1
+            self._start_workers()
+            self._cond.notify()
+            return entry["future"]
+
+    def cancel(self, future):
+        """
+        Give up on a submitted request. A queued request is dropped once every
+        coalesced caller has cancelled; a running one is left to finish.
+        """
+        with self._cond:
+            entry = self._entries.get(future)
+            if entry is None:
+                return
+            entry["waiters"] -= 1
+            if entry["waiters"] > 0:
+                return
+            if future.cancel():
+                self.cancelled += 1
+                self._forget(entry)
+
+    def invoke(self, llm, prompt, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Generate a completion through the queue, coalescing identical prompts for the same LLM."""
+        future = self.submit(llm.invoke, prompt, key=(id(llm), prompt), priority=priority)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except TimeoutError:
+            with self._cond:
+                self.timeouts += 1
+            self.cancel(future)
+            raise TimeoutError(f"LLM request timed out after {timeout or self.timeout:g}s")
+
+    def stream(self, llm, prompt, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """
+        Stream a completion through the queue, yielding tokens as the worker produces them.
+        `timeout` bounds the wait for each token (including the first). Closing the
+        generator early stops the generation at the next token.
+        """
+        tokens = queue.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            for token in llm.stream(prompt):
+                if stopped.is_set():
+                    break
+                tokens.put(token)
+
+        future = self.submit(produce, priority=priority)
+        future.add_done_callback(lambda _: tokens.put(_END))
+        try:
+            while True:
+                try:
+                    token = tokens.get(timeout=timeout or self.timeout)
+                except queue.Empty:
+                    with self._cond:
+                        self.timeouts += 1
+                    raise TimeoutError(f"LLM stream stalled for {timeout or self.timeout:g}s")
+                if token is _END:
+                    break
+                yield token
+            future.result()
+        finally:
+            stopped.set()
+            self.cancel(future)
+
+    def _start_workers(self):
+        # Called with self._cond held
+        while len(self._threads) < self.concurrency:
+            thread = threading.Thread(target=self._worker, name=f"llm-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _forget(self, entry):
+        # Called with self._cond held
+        if entry["key"] is not None and self._inflight.get(entry["key"]) is entry:
+            del self._inflight[entry["key"]]
+        self._entries.pop(entry["future"], None)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, entry = heapq.heappop(self._heap)
+                if not entry["future"].set_running_or_notify_cancel():
+                    # Cancelled while queued
+                    continue
+                self.running += 1
+
+            started = time.perf_counter()
+            self.wait_seconds.observe(started - entry["queued_at"])
+            try:
+                result = entry["fn"](*entry["args"])
+            except BaseException as e:
+                error = e
+            else:
+                error = None
+            self.run_seconds.observe(time.perf_counter() - started)
+
+            with self._cond:
+                self.running -= 1
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._forget(entry)
+
+            if error is None:
+                entry["future"].set_result(result)
+            else:
+                entry["future"].set_exception(error)
+
+    def stats(self):
+        with self._cond:
+            queued_by_priority = {}
+            for priority, _, _ in self._heap:
+                queued_by_priority[priority] = queued_by_priority.get(priority, 0) + 1
+            counters = {
+                "concurrency": self.concurrency,
+                "timeout": self.timeout,
+                "max_queue": self.max_queue,
+                "queue_depth": len(self._heap),
+                "queued_by_priority": queued_by_priority,
+                "running": self.running,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+            }
+        counters["wait_seconds"] = self.wait_seconds.snapshot()
+        counters["generation_seconds"] = self.run_seconds.snapshot()
+        return counters
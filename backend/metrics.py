@@ -0,0 +1,263 @@
+import bisect
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Thread-safe cumulative histogram of observed values (e.g. latencies in seconds)."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Return count, sum, mean and cumulative bucket counts."""
+        with self._lock:
+            cumulative = []
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), self._counts):
+                running += count
+                cumulative.append((bound, running))
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 6),
+                "mean": round(self._sum / self._count, 6) if self._count else 0.0,
+                "buckets": cumulative,
+            }
+
+    def samples(self, labels=None):
+        """Prometheus text samples (_bucket, _sum, _count) of this histogram."""
+        snapshot = self.snapshot()
+        lines = []
+        for bound, count in snapshot["buckets"]:
+            le = bound if bound == "+Inf" else format_value(bound)
+            lines.append(f"{self.name}_bucket{format_labels(labels, le=le)} {count}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(snapshot['sum'])}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {snapshot['count']}")
+        return lines
+
+    def exposition(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"] + self.samples()
+
+
+class HistogramFamily:
+    """Histograms of one metric split by label values, e.g. one per (operation, stage)."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Return the histogram for these label values, creating it on first use."""
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = Histogram(self.name, self.help, self.buckets)
+            return child
+
+    def snapshot(self):
+        """Return the snapshot of every child, keyed by its label values joined with "/"."""
+        with self._lock:
+            children = dict(self._children)
+        return {"/".join(values): child.snapshot() for values, child in sorted(children.items())}
+
+    def exposition(self):
+        with self._lock:
+            children = sorted(self._children.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in children:
+            lines.extend(child.samples(dict(zip(self.label_names, values))))
+        return lines
+
+
+class Gauge:
+    """Thread-safe gauge split by one label, e.g. in-flight requests per endpoint."""
+
+    def __init__(self, name, help_text, label_name):
+        self.name = name
+        self.help = help_text
+        self.label_name = label_name
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def dec(self, label_value, amount=1):
+        self.inc(label_value, -amount)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for label_value, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{format_labels({self.label_name: label_value})} {format_value(value)}")
+        return lines
+
+
+def format_value(value):
+    """Format a sample value the way Prometheus expects (integers without a decimal point)."""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels=None, **extra):
+    """Render {name="value",...}, escaping values; empty when there are no labels."""
+    labels = {**(labels or {}), **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def metric_name(*parts):
+    """Join parts into a valid Prometheus metric name."""
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(str(part) for part in parts if part))
+
+
+def stats_exposition(prefix, stats, label_names=None, labels=None):
+    """
+    Export the numeric values of a stats() dict as gauges named <prefix>_<key>.
+    Nested dicts are flattened into the name, except keys listed in `label_names`
+    (e.g. {"memory": "subject"}), whose entries become label values. `stats` may also be
+    a list of (labels, stats) pairs, e.g. one per loaded model. Strings, lists and
+    histogram snapshots are skipped; histograms are exported by the Histogram itself.
+    """
+    label_names = label_names or {}
+    samples = {}
+
+    def walk(name, value, labels):
+        if isinstance(value, dict):
+            if "buckets" in value:
+                return
+            for key, item in value.items():
+                if key in label_names and isinstance(item, dict):
+                    for label_value, entry in item.items():
+                        walk(name + [key], entry, {**labels, label_names[key]: label_value})
+                else:
+                    walk(name + [key], item, labels)
+        elif isinstance(value, (int, float)):
+            samples.setdefault(metric_name(prefix, *name), []).append((labels, value))
+
+    for entry_labels, entry in (stats if isinstance(stats, list) else [(labels or {}, stats)]):
+        walk([], entry, entry_labels)
+    lines = []
+    for name, values in samples.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{format_labels(labels)} {format_value(value)}" for labels, value in values)
+    return lines
+
+
+class Trace:
+    """Stage durations recorded while handling one request or background job, in the order they ended."""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, stage, seconds):
+        self.spans.append((stage, seconds))
+
+    def server_timing(self):
+        """Render the spans as a Server-Timing header value (durations in milliseconds)."""
+        entries = [f"{metric_name(stage)};dur={seconds * 1000:.1f}" for stage, seconds in self.spans]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# The trace of the request or job running in the current thread, if any
+_current_trace = ContextVar("trace", default=None)
+
+
+def start_trace(operation):
+    """Start a trace for the current thread; returns (trace, token) to pass to end_trace."""
+    trace = Trace(operation)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def traced(operation):
+    """Trace a block of background work (e.g. an ingest job) as one operation."""
+    trace, token = start_trace(operation)
+    try:
+        yield trace
+    finally:
+        end_trace(token)
+
+
+def record_stage(stage, seconds, operation=None):
+    """Record a stage duration in stage_seconds and in the current trace."""
+    trace = current_trace()
+    operation = operation or (trace.operation if trace is not None else "background")
+    stage_seconds.labels(operation, stage).observe(seconds)
+    if trace is not None and trace.operation == operation:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage, timings=None):
+    """
+    Time a block as one stage of the current operation. The duration goes to
+    stage_seconds, the current trace (for Server-Timing) and `timings` if given.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings[stage] = elapsed
+        record_stage(stage, elapsed)
+
+
+# Time from the start of LLM generation to the first streamed token
+ttft_seconds = Histogram("rag_time_to_first_token_seconds", "Time to first streamed LLM token on /rag/stream")
+
+# Request latency and concurrency per endpoint (Flask URL rule)
+request_seconds = HistogramFamily("rag_request_seconds", "Time to handle a request", ("endpoint", "status"))
+requests_in_flight = Gauge("rag_requests_in_flight", "Requests currently being handled", "endpoint")
+
+# Duration of each stage (load_index, embed_query, retrieve, generate, ...) per endpoint or job
+stage_seconds = HistogramFamily("rag_stage_seconds", "Duration of each pipeline stage", ("operation", "stage"))
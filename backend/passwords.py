@@ -0,0 +1,113 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from metrics import Histogram
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_TIMEOUT
+
+
+class HasherBusy(RuntimeError):
+    """Raised when too many hash operations are already queued."""
+
+
+class HasherTimeout(HasherBusy):
+    """Raised when a hash operation does not finish within the timeout; it keeps its slot until it does."""
+
+
+def hash_rounds(hashed):
+    """Return the cost factor of a bcrypt hash ("$2b$12$..." -> 12), or None if it is not one."""
+    if isinstance(hashed, bytes):
+        hashed = hashed.decode("utf-8")
+    match = re.match(r"^\$2[abxy]?\$(\d{2})\$", hashed)
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded thread pool (bcrypt releases the GIL while hashing),
+    so request threads only wait for the result. At most `max_pending` operations
+    may be queued or running; beyond that, calls fail fast with HasherBusy.
+    A call that waits longer than `timeout` raises HasherTimeout.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS,
+                 max_pending=PASSWORD_HASH_MAX_PENDING, timeout=PASSWORD_HASH_TIMEOUT):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.rehashed = 0
+        self.hash_seconds = Histogram("password_hash_seconds", "Time to hash or verify a password, including queueing")
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy("Too many password operations in progress, try again shortly")
+        start = time.perf_counter()
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._finish(start)
+            raise
+        # The slot is held until the operation itself is done, even if the caller stops waiting
+        future.add_done_callback(lambda _: self._finish(start))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise HasherTimeout("Password operation timed out, try again shortly") from None
+
+    def _finish(self, start):
+        self._slots.release()
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self.hash_seconds.observe(time.perf_counter() - start)
+
+    def hash(self, password):
+        """Hash a password with the configured cost factor."""
+        return self._run(lambda: bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)))
+
+    def verify(self, password, hashed):
+        """Check a password against a stored bcrypt hash."""
+        if isinstance(hashed, str):
+            hashed = hashed.encode("utf-8")
+        return self._run(bcrypt.checkpw, password.encode("utf-8"), hashed)
+
+    def rehash(self, password):
+        """Hash a password again with the configured cost factor, e.g. after the cost changed."""
+        hashed = self.hash(password)
+        with self._lock:
+            self.rehashed += 1
+        return hashed
+
+    def needs_rehash(self, hashed):
+        """True when a stored hash was made with a different cost factor than the configured one."""
+        return hash_rounds(hashed) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "rehashed": self.rehashed,
+            }
+        counters["hash_seconds"] = self.hash_seconds.snapshot()
+        return counters
@@ -0,0 +1,16 @@
+from langchain.text_splitter import TokenTextSplitter
+from langchain.document_loaders import PyPDFLoader
+
+# Splitter settings used for every subject
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# Kept free of model and index imports: parser worker processes import only this module
+# (and the entry point, server.py, whose app import is behind its __main__ guard)
+
+
+def load_and_split(file_path):
+    """Load a PDF and split it into token chunks."""
+    documents = PyPDFLoader(file_path).load()
+    token_splitter = TokenTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return token_splitter.split_documents(documents)
@@ -0,0 +1,45 @@
+import numpy as np
+from config import EMBEDDING_QUANTIZATION
+
+QUANTIZATIONS = ("none", "float16", "int8")
+
+
+def quantization_mode(mode=None):
+    """Validate a quantization mode, defaulting to EMBEDDING_QUANTIZATION."""
+    mode = mode or EMBEDDING_QUANTIZATION
+    if mode not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{mode}', expected one of {', '.join(QUANTIZATIONS)}")
+    return mode
+
+
+def quantize(embeddings, mode=None):
+    """
+    Compress float32 embeddings for storage. Returns (codes, scale):
+    float32 or float16 codes with scale None, or int8 codes with a float32 scale per
+    dimension (symmetric scalar quantization, value = code * scale).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    mode = quantization_mode(mode)
+    if mode == "none":
+        return embeddings, None
+    if mode == "float16":
+        return embeddings.astype(np.float16), None
+
+    scale = np.abs(embeddings).max(axis=0) / 127.0 if len(embeddings) else np.ones(embeddings.shape[1], dtype=np.float32)
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(embeddings / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+def dequantize(codes, scale=None):
+    """Return float32 embeddings from codes written by `quantize`."""
+    if codes.dtype == np.int8:
+        if scale is None:
+            raise ValueError("int8 embeddings need their scale")
+        return codes.astype(np.float32) * scale
+    return np.asarray(codes, dtype=np.float32)
+
+
+def quantization_of(codes):
+    """Quantization mode of stored embedding codes."""
+    return {np.dtype(np.float16): "float16", np.dtype(np.int8): "int8"}.get(codes.dtype, "none")
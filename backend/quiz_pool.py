@@ -0,0 +1,234 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from chunk_store import open_chunks, chunk_store_version
+from config import QUIZ_POOL_TARGET, QUIZ_POOL_LOW_WATER, QUIZ_POOL_QUESTIONS_PER_CHUNK, QUIZ_POOL_MAX_FAILURES, QUIZ_MAP_CONCURRENCY, QUIZ_RETRIES, QUIZ_MAX_QUESTIONS
+
+# Pre-generated quiz questions, saved next to the subject's index
+QUIZ_POOL_FILE = "quiz_pool.json"
+
+
+def question_key(question):
+    """Normalized question text, used to drop duplicate questions."""
+    return re.sub(r"\W+", " ", question.lower()).strip()
+
+
+def generate_with_retry(generate, text, count, retries=QUIZ_RETRIES):
+    """
+    Call generate(text, count), retrying when the response fails validation (ValueError).
+    Other errors, such as LLM timeouts, are raised straight away.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return generate(text, count)
+        except ValueError:
+            if attempt == retries:
+                raise
+
+
+def generate_from_chunks(generate, texts, num_questions, per_chunk=QUIZ_POOL_QUESTIONS_PER_CHUNK,
+                         concurrency=QUIZ_MAP_CONCURRENCY, retries=QUIZ_RETRIES, exclude=()):
+    """
+    Map-reduce quiz generation: ask for `per_chunk` questions from each of several chunks
+    concurrently, validate and retry each sub-request on its own, then merge and de-duplicate.
+    `texts` are candidate chunks in the order to use them; unused ones cover a shortfall.
+    Raises the last sub-request error if no question could be generated.
+    """
+    questions = []
+    seen = {question_key(question["question"]) for question in exclude}
+    texts = list(texts)
+    last_error = None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while len(questions) < num_questions and texts:
+            missing = num_questions - len(questions)
+            batch, texts = texts[:math.ceil(missing / per_chunk)], texts[math.ceil(missing / per_chunk):]
+            futures = [executor.submit(generate_with_retry, generate, text, per_chunk, retries) for text in batch]
+            for future in futures:
+                try:
+                    results = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                for question in results:
+                    key = question_key(question["question"])
+                    if key not in seen:
+                        seen.add(key)
+                        questions.append(question)
+
+    if not questions and last_error is not None:
+        raise last_error
+    return questions[:num_questions]
+
+
+class QuizPool:
+    """
+    Per-subject bank of validated quiz questions, built in the background from many
+    chunks of the subject's index. `take` removes and returns random questions, and a
+    refill is started whenever fewer than `low_water` remain. A pool belongs to one
+    index version: re-chunking a subject starts a new pool.
+
+    `generate(text, count)` must return a list of valid questions for one chunk.
+    """
+
+    def __init__(self, generate, target=QUIZ_POOL_TARGET, low_water=QUIZ_POOL_LOW_WATER,
+                 per_chunk=QUIZ_POOL_QUESTIONS_PER_CHUNK, max_failures=QUIZ_POOL_MAX_FAILURES):
+        self.generate = generate
+        self.target = target
+        self.low_water = low_water
+        self.per_chunk = per_chunk
+        self.max_failures = max_failures
+        self._pools = {}       # subject -> pool state
+        self._filling = set()  # subjects with a refill thread running
+        self._lock = threading.Lock()
+        self.served = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.failures = 0
+
+    def take(self, subject, vector_store_path, count):
+        """Remove up to `count` random questions from the subject's pool and return them."""
+        pool = self._pool(subject, vector_store_path)
+        with self._lock:
+            picked = random.sample(pool["questions"], min(count, len(pool["questions"])))
+            picked_ids = {id(question) for question in picked}
+            pool["questions"] = [question for question in pool["questions"] if id(question) not in picked_ids]
+            remaining = len(pool["questions"])
+            self.served += len(picked)
+            self._save(vector_store_path, pool)
+
+        if remaining < self.low_water:
+            self.refill(subject, vector_store_path)
+        # "chunk" records where a question came from; it is internal to the pool
+        return [{key: value for key, value in question.items() if key != "chunk"} for question in picked]
+
+    def refill(self, subject, vector_store_path):
+        """Top the subject's pool up to `target` questions in a background thread."""
+        with self._lock:
+            if subject in self._filling:
+                return
+            self._filling.add(subject)
+        threading.Thread(target=self._fill, args=(subject, vector_store_path), daemon=True).start()
+
+    def invalidate(self, subject):
+        """Forget the in-memory pool of a subject, e.g. after it is re-chunked."""
+        with self._lock:
+            self._pools.pop(subject, None)
+
+    def available(self, subject, vector_store_path):
+        """Number of questions the subject's pool holds for its current index version."""
+        pool = self._pool(subject, vector_store_path)
+        with self._lock:
+            return len(pool["questions"])
+
+    def remaining(self, subject):
+        with self._lock:
+            pool = self._pools.get(subject)
+            return len(pool["questions"]) if pool else 0
+
+    def _pool(self, subject, vector_store_path):
+        version = chunk_store_version(vector_store_path)
+        with self._lock:
+            pool = self._pools.get(subject)
+            if pool is None or pool["version"] != version:
+                pool = self._load(vector_store_path, version)
+                self._pools[subject] = pool
+            return pool
+
+    def _load(self, vector_store_path, version):
+        try:
+            with open(os.path.join(vector_store_path, QUIZ_POOL_FILE), encoding="utf-8") as f:
+                pool = json.load(f)
+            if pool.get("version") == version:
+                pool["seen"] = set(pool["seen"])
+                return pool
+        except (OSError, ValueError, KeyError):
+            pass
+        return {"version": version, "questions": [], "next_chunk": 0, "seen": set()}
+
+    def _save(self, vector_store_path, pool):
+        # Called with self._lock held
+        if not os.path.isdir(vector_store_path):
+            return
+        state = dict(pool, seen=sorted(pool["seen"]))
+        tmp_path = os.path.join(vector_store_path, QUIZ_POOL_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, os.path.join(vector_store_path, QUIZ_POOL_FILE))
+
+    def _fill(self, subject, vector_store_path):
+        try:
+            while True:
+                version = chunk_store_version(vector_store_path)
+                self._fill_version(subject, vector_store_path, version)
+                # Start over if the subject was re-chunked while we were generating
+                if chunk_store_version(vector_store_path) == version:
+                    break
+        except Exception as e:
+            print(f"Quiz pool refill for '{subject}' failed: {e}")
+        finally:
+            with self._lock:
+                self._filling.discard(subject)
+
+    def _fill_version(self, subject, vector_store_path, version):
+        chunks = open_chunks(vector_store_path)
+        if chunks is None or len(chunks) == 0:
+            return
+        pool = self._pool(subject, vector_store_path)
+        if pool["version"] != version:
+            return
+
+        # Visit chunks in a shuffled order that is stable for this index version,
+        # so questions are spread across the whole subject
+        order = list(range(len(chunks)))
+        random.Random(str(version)).shuffle(order)
+
+        failures = 0
+        for _ in range(len(chunks)):
+            with self._lock:
+                if len(pool["questions"]) >= self.target:
+                    return
+                position = order[pool["next_chunk"] % len(order)]
+                pool["next_chunk"] += 1
+            if chunk_store_version(vector_store_path) != version:
+                return
+
+            try:
+                questions = generate_with_retry(self.generate, chunks.text(position), self.per_chunk)
+                failures = 0
+            except Exception as e:
+                print(f"Quiz generation for chunk {position} of '{subject}' failed: {e}")
+                failures += 1
+                with self._lock:
+                    self.failures += 1
+                if failures >= self.max_failures:
+                    return
+                continue
+
+            with self._lock:
+                for question in questions:
+                    key = question_key(question["question"])
+                    if key in pool["seen"]:
+                        self.duplicates += 1
+                        continue
+                    pool["seen"].add(key)
+                    pool["questions"].append(dict(question, chunk=position))
+                    self.generated += 1
+                self._save(vector_store_path, pool)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subjects": {subject: len(pool["questions"]) for subject, pool in self._pools.items()},
+                "filling": sorted(self._filling),
+                "target": self.target,
+                "low_water": self.low_water,
+                "served": self.served,
+                "generated": self.generated,
+                "duplicates": self.duplicates,
+                "failures": self.failures,
+            }
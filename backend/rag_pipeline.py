@@ -1,33 +1,99 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
 import os
+import sys
 import json
+import math
 from pydantic import BaseModel
-from langchain.text_splitter import TokenTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain.document_loaders import PyPDFLoader
 from langchain.prompts import PromptTemplate
 from sentence_transformers import SentenceTransformer
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.llms import Ollama
 from langchain.llms.base import LLM
 import markdown
-from sklearn.manifold import TSNE
 import numpy as np
+import random
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from embedding_registry import get_embedding_model, embedding_model_stats
+from vector_store_cache import VectorStoreCache, index_version
+from chunk_store import open_chunks
+from ingestion import update_subject_index
+from chunk_cache import chunk_cache
+from ingest_jobs import IngestJobQueue
+from tsne_layout import corpus_layout, project_points
+from retrieval import search, merge_hits, stored_vectors, build_context
+from metrics import (
+    ttft_seconds, stage_seconds, request_seconds, requests_in_flight,
+    span, record_stage, traced, start_trace, end_trace, stats_exposition
+)
+from answer_cache import SemanticAnswerCache
+from quiz_pool import QuizPool, generate_from_chunks, QUIZ_POOL_QUESTIONS_PER_CHUNK, QUIZ_MAX_QUESTIONS
+from upload_store import UploadRequest, store_upload, UPLOAD_MAX_REQUEST_BYTES
+from llm_scheduler import LLMScheduler, SchedulerQueueFull, PRIORITY_INTERACTIVE, PRIORITY_QUIZ, PRIORITY_BATCH, PRIORITY_BACKGROUND
+from config import RAG_BATCH_MAX_QUERIES, RAG_BATCH_CONCURRENCY, FEDERATED_SEARCH_WORKERS, SERVER_TIMING
 # Flask app setup
 app = Flask(__name__)
+app.request_class = UploadRequest  # Stream uploaded files to disk while hashing them
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_REQUEST_BYTES
 CORS(app)
 
 # Define the directory to save uploaded files
 UPLOAD_FOLDER = 'uploads/'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Most chunks a query may retrieve ("k")
+RAG_MAX_K = 50
+
+# Threads searching subject shards for cross-subject /rag queries
+shard_executor = ThreadPoolExecutor(max_workers=FEDERATED_SEARCH_WORKERS)
+
 # Global variables
 ollama_llm = None
-vector_stores = {}
-chunked_data = {}
+quiz_llm = None  # Used by quiz generation when /initialize has not run yet
+vector_stores = VectorStoreCache()  # Per-subject LRU cache of loaded FAISS indexes
+answer_cache = SemanticAnswerCache()  # Answers to near-identical questions, per subject and index version
+
+# Every LLM call goes through one queue with a concurrency cap
+llm_scheduler = LLMScheduler()
+
+
+@app.before_request
+def start_request_trace():
+    """Trace each request so stage spans can be attributed to its endpoint."""
+    g.operation = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    g.trace, g.trace_token = start_trace(g.operation)
+    requests_in_flight.inc(g.operation)
+    g.in_flight = True
+
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.get("trace")
+    if trace is not None:
+        request_seconds.labels(g.operation, str(response.status_code)).observe(time.perf_counter() - trace.start)
+        if SERVER_TIMING or request.headers.get("X-Server-Timing") == "1":
+            response.headers["Server-Timing"] = trace.server_timing()
+            response.headers["Timing-Allow-Origin"] = "*"
+    if g.get("in_flight"):
+        # Streamed responses (/rag/stream) keep sending after the view returns; count them until closed
+        operation = g.operation
+        response.call_on_close(lambda: requests_in_flight.dec(operation))
+        g.in_flight = False
+    return response
+
+
+@app.teardown_request
+def end_request_trace(error=None):
+    if g.get("in_flight"):
+        # No response was finalized, e.g. the request failed outside the view
+        requests_in_flight.dec(g.operation)
+        g.in_flight = False
+    if g.get("trace_token") is not None:
+        end_trace(g.trace_token)
+        g.trace_token = None
+
 
 # Define a custom LLM wrapper for Ollama to integrate with LangChain
 class OllamaLLM(LLM, BaseModel):
@@ -55,14 +121,17 @@ PROMPT = PromptTemplate(
 
 @app.route('/initialize', methods=['POST'])
 def initialize_model():
-    """Endpoint to initialize the Ollama model."""
+    """Endpoint to initialize the Ollama model and the shared embedding model."""
     global ollama_llm
 
+    # Warm up the shared embedding model so the first query does not pay for loading it
+    get_embedding_model()
+
     if ollama_llm is None:
         ollama_llm = Ollama(model="llama3.2")
-        return jsonify({"message": "Model initialized successfully"}), 200
+        return jsonify({"message": "Model initialized successfully", "embedding_models": embedding_model_stats()}), 200
     else:
-        return jsonify({"message": "Model already initialized"}), 200
+        return jsonify({"message": "Model already initialized", "embedding_models": embedding_model_stats()}), 200
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -70,19 +139,43 @@ def upload_file():
     if 'files' not in request.files:
         return jsonify({"error": "No file part"}), 400
 
-    file = request.files['files']
+    files = request.files.getlist('files')
     subject = request.form.get('subject')
+    replace = request.form.get('replace') == 'true'  # Overwrite a different file with the same name
 
-    if file.filename == '':
+    if any(file.filename == '' for file in files):
         return jsonify({"error": "No selected file"}), 400
+    if not subject:
+        return jsonify({"error": "Subject is required"}), 400
 
     subject_path = os.path.join(UPLOAD_FOLDER, subject)
-    os.makedirs(subject_path, exist_ok=True)  # Ensure the directory is created
-
-    file_path = os.path.join(subject_path,  file.filename)
-    file.save(file_path)
 
-    return jsonify({"message": "File uploaded successfully", "filePath": file_path}), 200
+    # Files were streamed to disk and hashed while the request was parsed; move them into place,
+    # or point at the stored copy when the same content was uploaded before
+    uploaded, conflicts = [], []
+    for file in files:
+        file_name = os.path.basename(file.filename.replace("\\", "/"))
+        try:
+            uploaded.append(store_upload(file, subject_path, file_name, replace=replace))
+        except FileExistsError as e:
+            conflicts.append({"fileName": file_name, "error": str(e)})
+
+    response = {
+        "message": "File uploaded successfully" if not conflicts else "Some files already exist with different content",
+        "files": uploaded,
+        "conflicts": conflicts,
+    }
+    if uploaded:
+        response["filePath"] = uploaded[0]["filePath"]
+        response["documentId"] = uploaded[0]["documentId"]
+    return jsonify(response), 409 if conflicts else 200
+
+
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def upload_rejected(e):
+    """Report rejected uploads (too large, wrong type) as JSON like the other errors."""
+    return jsonify({"error": e.description}), e.code
 
 @app.route('/delete', methods=['DELETE'])
 def delete_file():
@@ -102,15 +195,59 @@ def delete_file():
     if os.path.exists(file_path):
         try:
             os.remove(file_path)
-            return jsonify({"message": f"File '{file_name}' deleted successfully"}), 200
+
+            # Drop the file's chunks from the subject's vector store in the background; poll /jobs/<id>
+            job = ingest_jobs.submit(subject, remove_paths=[file_path])
+            return jsonify({"message": f"File '{file_name}' deleted successfully", **job.to_dict()}), 202
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     else:
         return jsonify({"error": f"File '{file_name}' not found."}), 404
 
+def run_chunk_job(job):
+    """Run a queued /chunk or /delete job: update the subject's index and refresh the cached copy."""
+    with traced("chunk"):
+        return _run_chunk_job(job)
+
+
+def _run_chunk_job(job):
+    vector_store_file = os.path.join(UPLOAD_FOLDER, job.subject, "vector_store")
+
+    # Index only new or changed files and drop files that are no longer listed or were deleted
+    vector_store, summary = update_subject_index(
+        job.file_paths, vector_store_file, progress=job.update, remove_paths=job.remove_paths
+    )
+    for stage, ms in summary["timings"].items():
+        record_stage(stage, ms / 1000)
+    if summary["changed"]:
+        answer_cache.invalidate(job.subject)
+        if vector_store is None:
+            vector_stores.invalidate(job.subject)
+        else:
+            vector_stores.put(job.subject, vector_store_file, vector_store)  # Replace any stale cached copy
+
+    # Precompute the t-SNE layout for the new index version so /tsne and /rag do not have to
+    chunks = open_chunks(vector_store_file)
+    if chunks is not None:
+        job.update("layout", 98)
+        with span("layout"):
+            corpus_layout(vector_store_file, chunks)
+
+    # Build the quiz pool for the new index version in the background
+    if summary["changed"]:
+        quiz_pool.invalidate(job.subject)
+    if chunks is not None:
+        quiz_pool.refill(job.subject, vector_store_file)
+    return summary
+
+
+# Background ingestion queue used by /chunk and /delete
+ingest_jobs = IngestJobQueue(run_chunk_job)
+
+
 @app.route('/chunk', methods=['POST'])
 def chunk_files():
-    """Endpoint to process multiple uploaded files into chunks and return embeddings for t-SNE."""
+    """Endpoint to queue uploaded files for chunking and indexing; returns a job ID to poll on /jobs/<id>."""
     data = request.get_json()
     file_paths = data.get("filePaths")
     subject = data.get("subject")
@@ -121,45 +258,27 @@ def chunk_files():
         return jsonify({"error": "Subject is required"}), 400
 
     subject_folder = os.path.join(UPLOAD_FOLDER, subject)
-    vector_store_file = os.path.join(subject_folder, "vector_store")
     os.makedirs(subject_folder, exist_ok=True)
 
+    # Check every file before queueing any work
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            return jsonify({"error": f"File not found: {file_path}"}), 400
+
     try:
-        embedding_model = HuggingFaceEmbeddings(model_name='all-MiniLM-L6-v2')
-        all_texts = []
-        embeddings = []
-
-        # Process each file
-        for file_path in file_paths:
-            if os.path.exists(file_path):
-                loader = PyPDFLoader(file_path)
-                documents = loader.load()
-
-                token_splitter = TokenTextSplitter(chunk_size=500, chunk_overlap=50)
-                texts = token_splitter.split_documents(documents)
-                all_texts.extend(texts)  # Collect all texts
-
-                # Generate embeddings for each text chunk
-                embeddings.extend(embedding_model.embed_documents([text.page_content for text in texts]))
-            else:
-                return jsonify({"error": f"File not found: {file_path}"}), 400
-
-        # Create the vector store from all combined texts
-        vector_store = FAISS.from_documents(all_texts, embedding=embedding_model)
-
-        # Save the vector store
-        vector_store.save_local(vector_store_file)
-        vector_stores[subject] = vector_store  # Cache the vector store in memory
-
-        # Store chunked data in memory
-        chunked_data[subject] = {
-            "embeddings": embeddings,
-            "texts": [text.page_content for text in all_texts]
-        }
-
-        return jsonify({"message": "All files processed and vector store updated successfully"}), 200
+        job = ingest_jobs.submit(subject, file_paths)
+        return jsonify({"message": "Files queued for processing", **job.to_dict()}), 202
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Endpoint to report the stage, progress and errors of a /chunk job."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found."}), 404
+    return jsonify(job.to_dict()), 200
     
 @app.route('/tsne', methods=['POST'])
 def tsne_visualization():
@@ -169,32 +288,32 @@ def tsne_visualization():
 
     if not subject:
         return jsonify({"error": "Subject is required"}), 400
-    if subject not in chunked_data:
+
+    vector_store_file = os.path.join(UPLOAD_FOLDER, subject, "vector_store")
+    with span("open_chunks"):
+        chunks = open_chunks(vector_store_file)
+    if chunks is None:
         return jsonify({"error": f"No chunked data available for subject '{subject}'"}), 404
 
     try:
-        # # Debug: Log the chunked_data structure
-        # print(f"Chunked data keys: {chunked_data.keys()}")
-        # print(f"Chunked data for subject: {chunked_data[subject]}")
-
-        # Retrieve embeddings and texts
-        embeddings = np.array(chunked_data[subject]["embeddings"])
-        texts = chunked_data[subject]["texts"]
+        # Retrieve embeddings (memory-mapped) and texts
+        with span("read_chunks"):
+            embeddings = chunks.embeddings
+            texts = chunks.texts()
 
         # Validate embeddings
         if embeddings.ndim != 2:
             return jsonify({"error": "Embeddings should be a 2D array."}), 400
 
-        # Perform t-SNE
-        n_samples = len(embeddings)
-        perplexity = min(30, n_samples - 1)
-        tsne = TSNE(n_components=2, perplexity=min(30,perplexity-1),random_state=42)
-        tsne_results = tsne.fit_transform(embeddings)
+        # t-SNE layout of the corpus, computed once per index version
+        with span("layout"):
+            tsne_results = corpus_layout(vector_store_file, chunks)
 
-        tsne_data = [
-            {"x": float(coord[0]), "y": float(coord[1]), "text": text}
-            for coord, text in zip(tsne_results, texts)
-        ]
+        with span("serialize"):
+            tsne_data = [
+                {"x": float(coord[0]), "y": float(coord[1]), "text": text}
+                for coord, text in zip(tsne_results, texts)
+            ]
 
         return jsonify({"data": tsne_data}), 200
     except Exception as e:
@@ -214,13 +333,13 @@ def preview_files():
             if not os.path.exists(subject_folder):
                 return jsonify({"error": f"Subject folder '{subject}' does not exist."}), 404
 
-            files = os.listdir(subject_folder)
+            files = [name for name in os.listdir(subject_folder) if not name.startswith(".")]
             return jsonify({"subject": subject, "files": files}), 200
         else:  # If no subject is provided, return files from all subjects
             all_files = []
             for subject in os.listdir(UPLOAD_FOLDER):
                 subject_folder = os.path.join(UPLOAD_FOLDER, subject)
-                if os.path.isdir(subject_folder):
+                if os.path.isdir(subject_folder) and not subject.startswith("."):  # Skip the upload staging folder
                     files = os.listdir(subject_folder)
                     all_files.append({"subject": subject, "files": files})
 
@@ -229,95 +348,317 @@ def preview_files():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
-@app.route('/rag', methods=['POST'])
-def rag_pipeline():
-    """Endpoint to handle the RAG pipeline for queries."""
+def int_param(data, name, default, minimum=1, maximum=None):
+    """Read an integer from a request body; raises ValueError with a message for a 400 response."""
+    try:
+        value = int(data.get(name, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+    if value < minimum or (maximum is not None and value > maximum):
+        bounds = f"between {minimum} and {maximum}" if maximum is not None else f"at least {minimum}"
+        raise ValueError(f"{name} must be {bounds}")
+    return value
+
+
+def retrieve_for_query(subject, vector_store_file, query, timings, k=5):
+    """
+    Load a subject's index, embed the query once and run a single retrieval pass.
+    Returns (vector_store, query_embedding, hits); stage durations are added to `timings`.
+    """
+    with span("load_index", timings):
+        try:
+            vector_store = vector_stores.get(subject, vector_store_file)
+        except Exception as e:
+            raise RuntimeError(f"Failed to load vector store: {str(e)}")
+
+    # Embed the query once; the same vector drives retrieval and the visualization
+    with span("embed_query", timings):
+        query_embedding = np.array([get_embedding_model().embed_query(query)], dtype=np.float32)
+
+    # Single retrieval pass; the hits' vectors are read back from the index instead of re-embedded
+    with span("retrieve", timings):
+        hits = search(vector_store, query_embedding, k=k)[0]
+    return vector_store, query_embedding, hits
+
+
+def search_shard(subject, query_embedding, k):
+    """Load one subject's index and search it; returns (hits, load seconds, search seconds)."""
+    vector_store_file = os.path.join(UPLOAD_FOLDER, subject, "vector_store")
+    start = time.perf_counter()
+    vector_store = vector_stores.get(subject, vector_store_file)
+    loaded = time.perf_counter()
+    hits = search(vector_store, query_embedding, k=k)[0]
+    return hits, loaded - start, time.perf_counter() - loaded
+
+
+def rag_federated(query, subjects, use_cache=True, k=5):
+    """
+    Answer a query from several subjects at once: every subject's index is searched in
+    parallel as a separate shard and the best k chunks across all of them form the context.
+    """
+    global ollama_llm
+
+    if subjects == "all":
+        subjects = sorted(
+            name for name in os.listdir(UPLOAD_FOLDER)
+            if os.path.exists(os.path.join(UPLOAD_FOLDER, name, "vector_store"))
+        )
+    if not isinstance(subjects, list) or not subjects or not all(isinstance(subject, str) and subject for subject in subjects):
+        return jsonify({"error": "Subjects must be a non-empty list of subject names or \"all\""}), 400
+    missing = [subject for subject in subjects if not os.path.exists(os.path.join(UPLOAD_FOLDER, subject, "vector_store"))]
+    if missing:
+        return jsonify({"error": f"Vector store not found for: {', '.join(missing)}"}), 404
+
+    if ollama_llm is None:
+        ollama_llm = OllamaLLM(model_name="llama3.2")
+
+    timings = {}
+    with span("embed_query", timings):
+        query_embedding = np.array([get_embedding_model().embed_query(query)], dtype=np.float32)
+
+    # Search every shard in parallel and merge their top-k lists
+    with span("retrieve", timings):
+        futures = {subject: shard_executor.submit(search_shard, subject, query_embedding, k) for subject in subjects}
+        shard_hits, shards = {}, {}
+        for subject, future in futures.items():
+            hits, load_seconds, search_seconds = future.result()
+            shard_hits[subject] = hits
+            shards[subject] = {
+                "hits": len(hits),
+                "load_index": round(load_seconds * 1000, 1),
+                "search": round(search_seconds * 1000, 1)
+            }
+        hits = merge_hits(shard_hits, k)
+
+    # Cache answers per set of subjects and their index versions
+    cache_subject = "federated:" + ",".join(sorted(subjects))
+    version = "|".join(str(index_version(os.path.join(UPLOAD_FOLDER, subject, "vector_store"))) for subject in sorted(subjects))
+    cached = answer_cache.lookup(cache_subject, version, query_embedding[0]) if use_cache else None
+    if cached is not None:
+        answer = cached[0]
+    else:
+        with span("generate", timings):
+            prompt = PROMPT.format(context=build_context([hit["doc"] for hit in hits]), question=query)
+            answer = llm_scheduler.invoke(ollama_llm, prompt, priority=PRIORITY_INTERACTIVE)
+        if use_cache:
+            answer_cache.store(cache_subject, version, query_embedding[0], query, answer)
+
+    return jsonify({
+        "answer": markdown.markdown(answer),
+        "cached": cached is not None,
+        "sources": [
+            {
+                "subject": hit["shard"],
+                "position": hit["position"],
+                "score": hit["score"],
+                "text": hit["doc"].page_content,
+                "metadata": hit["doc"].metadata
+            }
+            for hit in hits
+        ],
+        "shards": shards,
+        "timings": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+    }), 200
+
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+@app.route('/rag/stream', methods=['POST'])
+def rag_stream():
+    """Endpoint to stream the RAG answer as Server-Sent Events: sources first, then LLM tokens."""
     global ollama_llm
 
     data = request.get_json()
     query = data.get("query")
     subject = data.get("subject")
+    use_cache = data.get("cache", True)  # Set to false to always call the LLM
 
     if not query:
         return jsonify({"error": "Query is required"}), 400
     if not subject:
         return jsonify({"error": "Subject is required"}), 400
 
-    try:
-        if ollama_llm is None:
-            ollama_llm = OllamaLLM(model_name="llama3.2")
-
-        subject_folder = os.path.join(UPLOAD_FOLDER, subject)
-        vector_store_file = os.path.join(subject_folder, "vector_store")
+    vector_store_file = os.path.join(UPLOAD_FOLDER, subject, "vector_store")
+    if not os.path.exists(vector_store_file):
+        return jsonify({"error": f"Vector store for '{subject}' not found."}), 404
 
-        if not os.path.exists(vector_store_file):
-            return jsonify({"error": f"Vector store for '{subject}' not found."}), 404
+    if ollama_llm is None:
+        ollama_llm = OllamaLLM(model_name="llama3.2")
+    llm = ollama_llm
+    operation = g.get("operation", "/rag/stream")
 
-        embedding_model = HuggingFaceEmbeddings(model_name='all-MiniLM-L6-v2')
+    def generate():
+        # The body runs after the view has returned, so it gets its own trace
+        with traced(operation):
+            yield from stream_events()
 
+    def stream_events():
+        timings = {}
         try:
-            vector_store = FAISS.load_local(vector_store_file, embedding_model, allow_dangerous_deserialization=True)
+            vector_store, query_embedding, hits = retrieve_for_query(subject, vector_store_file, query, timings)
+            version = vector_store.stamp
+            retrieved_docs = [hit["doc"] for hit in hits]
+            yield sse_event("sources", {
+                "sources": [
+                    {"text": hit["doc"].page_content, "metadata": hit["doc"].metadata, "score": hit["score"]}
+                    for hit in hits
+                ]
+            })
+
+            # A near-identical question was already answered: send the cached answer in one event
+            cached = answer_cache.lookup(subject, version, query_embedding[0]) if use_cache else None
+            if cached is not None:
+                answer, similarity = cached
+                yield sse_event("token", {"token": answer})
+                yield sse_event("done", {
+                    "answer": markdown.markdown(answer),
+                    "cached": True,
+                    "cacheSimilarity": round(similarity, 4),
+                    "timings": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+                })
+                return
+
+            # Forward tokens as the model produces them
+            prompt = PROMPT.format(context=build_context(retrieved_docs), question=query)
+            start = time.perf_counter()
+            first_token = None
+            tokens = []
+            for token in llm_scheduler.stream(llm, prompt, priority=PRIORITY_INTERACTIVE):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    ttft_seconds.observe(first_token)
+                tokens.append(token)
+                yield sse_event("token", {"token": token})
+            timings["generate"] = time.perf_counter() - start
+            record_stage("generate", timings["generate"])
+            if first_token is not None:
+                timings["first_token"] = first_token
+                record_stage("first_token", first_token)
+
+            answer = "".join(tokens)
+            if use_cache:
+                answer_cache.store(subject, version, query_embedding[0], query, answer)
+            yield sse_event("done", {
+                "answer": markdown.markdown(answer),
+                "cached": False,
+                "timings": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+            })
         except Exception as e:
-            return jsonify({"error": f"Failed to load vector store: {str(e)}"}), 500
+            print(e)
+            yield sse_event("error", {"error": str(e)})
 
-        vector_stores[subject] = vector_store
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        # Generate embedding for the query
-        query_embedding = np.array(embedding_model.embed_documents([query]))
 
-        # Retrieve reference content
-        retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-        retrieved_docs = retriever.get_relevant_documents(query)
-        reference_texts = [doc.page_content for doc in retrieved_docs]
-        reference_embeddings = np.array(embedding_model.embed_documents(reference_texts))
-
-        # Load existing embeddings
-        existing_embeddings = np.array(chunked_data[subject]["embeddings"])
-        existing_texts = chunked_data[subject]["texts"]
-
-        # Perform t-SNE
-        all_embeddings = np.concatenate([existing_embeddings, reference_embeddings, query_embedding], axis=0)
-        n_samples = len(all_embeddings)
-        perplexity = min(30, n_samples - 1)
-        tsne = TSNE(n_components=2, perplexity=perplexity, random_state=42)
-        tsne_result = tsne.fit_transform(all_embeddings)
-
-        # Split t-SNE results
-        tsne_existing = tsne_result[:len(existing_embeddings)]
-        tsne_reference = tsne_result[len(existing_embeddings):-1]
-        tsne_query = tsne_result[-1]
-
-        # Run LLM for response
-        qa = RetrievalQA.from_chain_type(
-            llm=ollama_llm,
-            chain_type="stuff",
-            retriever=retriever,
-            chain_type_kwargs={"prompt": PROMPT},
-            return_source_documents=True
-        )
+@app.route('/rag/batch', methods=['POST'])
+def rag_batch():
+    """Endpoint to answer many queries for one subject in a single call."""
+    global ollama_llm
 
-        result = qa.invoke({"query": query})
-        answer = result['result']
+    data = request.get_json()
+    queries = data.get("queries")
+    subject = data.get("subject")
+    use_cache = data.get("cache", True)
+    try:
+        k = int_param(data, "k", 5, maximum=RAG_MAX_K)
+        concurrency = min(int_param(data, "concurrency", RAG_BATCH_CONCURRENCY), RAG_BATCH_CONCURRENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not queries or not isinstance(queries, list) or not all(isinstance(query, str) and query for query in queries):
+        return jsonify({"error": "Queries must be a non-empty list of strings"}), 400
+    if len(queries) > RAG_BATCH_MAX_QUERIES:
+        return jsonify({"error": f"At most {RAG_BATCH_MAX_QUERIES} queries per batch"}), 400
+    if not subject:
+        return jsonify({"error": "Subject is required"}), 400
 
-        # Prepare t-SNE data
-        tsne_existing_data = [
-            {"x": float(coord[0]), "y": float(coord[1]), "text": text}
-            for coord, text in zip(tsne_existing, existing_texts)
-        ]
-        tsne_reference_data = [
-            {"x": float(coord[0]), "y": float(coord[1]), "text": text}
-            for coord, text in zip(tsne_reference, reference_texts)
-        ]
+    vector_store_file = os.path.join(UPLOAD_FOLDER, subject, "vector_store")
+    if not os.path.exists(vector_store_file):
+        return jsonify({"error": f"Vector store for '{subject}' not found."}), 404
 
+    try:
+        if ollama_llm is None:
+            ollama_llm = OllamaLLM(model_name="llama3.2")
+        llm = ollama_llm
+
+        batch_start = time.perf_counter()
+        timings = {}
+
+        with span("load_index", timings):
+            vector_store = vector_stores.get(subject, vector_store_file)
+            version = vector_store.stamp
+
+        # Embed all queries in one batch and search them with one multi-query FAISS call
+        with span("embed_queries", timings):
+            query_embeddings = np.asarray(get_embedding_model().embed_documents(queries), dtype=np.float32)
+
+        with span("retrieve", timings):
+            all_hits = search(vector_store, query_embeddings, k=k)
+
+        # Retrieved chunks are returned once and referenced by position from each result
+        chunks = {}
+        for hits in all_hits:
+            for hit in hits:
+                chunks[hit["position"]] = {"text": hit["doc"].page_content, "metadata": hit["doc"].metadata}
+
+        # Cached answers first; identical (question, context) prompts are sent to the LLM once
+        answers = [None] * len(queries)
+        cached_flags = [False] * len(queries)
+        prompts = {}
+        for i, (query, hits) in enumerate(zip(queries, all_hits)):
+            cached = answer_cache.lookup(subject, version, query_embeddings[i]) if use_cache else None
+            if cached is not None:
+                answers[i] = cached[0]
+                cached_flags[i] = True
+                continue
+            prompt = PROMPT.format(context=build_context([hit["doc"] for hit in hits]), question=query)
+            prompts.setdefault(prompt, []).append(i)
+
+        # Generate the remaining answers with bounded concurrency
+        with span("generate", timings):
+            errors = [None] * len(queries)
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {executor.submit(llm_scheduler.invoke, llm, prompt, PRIORITY_BATCH): indexes for prompt, indexes in prompts.items()}
+                for future, indexes in futures.items():
+                    try:
+                        answer = future.result()
+                    except Exception as e:
+                        for i in indexes:
+                            errors[i] = str(e)
+                        continue
+                    for i in indexes:
+                        answers[i] = answer
+                    if use_cache:
+                        answer_cache.store(subject, version, query_embeddings[indexes[0]], queries[indexes[0]], answer)
+
+        results = []
+        for i, query in enumerate(queries):
+            results.append({
+                "query": query,
+                "answer": markdown.markdown(answers[i]) if answers[i] is not None else None,
+                "sources": [{"position": hit["position"], "score": hit["score"]} for hit in all_hits[i]],
+                "cached": cached_flags[i],
+                "error": errors[i]
+            })
+
+        elapsed = time.perf_counter() - batch_start
         return jsonify({
-            "answer": markdown.markdown(answer),
-            "query_point": {
-                "x": float(tsne_query[0]),
-                "y": float(tsne_query[1]),
-                "text": query
+            "results": results,
+            "chunks": {str(position): chunk for position, chunk in chunks.items()},
+            "throughput": {
+                "queries": len(queries),
+                "llmCalls": len(prompts),
+                "seconds": round(elapsed, 3),
+                "queriesPerSec": round(len(queries) / elapsed, 2) if elapsed > 0 else None
             },
-            "existing_embeddings": tsne_existing_data,
-            "reference_embeddings": tsne_reference_data
+            "timings": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
         }), 200
 
     except Exception as e:
@@ -325,6 +666,148 @@ def rag_pipeline():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/rag', methods=['POST'])
+def rag_pipeline():
+    """Endpoint to handle the RAG pipeline for queries (set "stream": true for Server-Sent Events)."""
+    global ollama_llm
+
+    data = request.get_json()
+    query = data.get("query")
+    subject = data.get("subject")
+    visualize = data.get("visualize", True)  # Set to false to skip the t-SNE payload
+    use_cache = data.get("cache", True)  # Set to false to always call the LLM
+
+    if data.get("stream"):
+        return rag_stream()
+
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    if not subject and not data.get("subjects"):
+        return jsonify({"error": "Subject is required"}), 400
+
+    try:
+        # Cross-subject query: "subjects" is a list of subjects or "all"
+        if data.get("subjects"):
+            try:
+                k = int_param(data, "k", 5, maximum=RAG_MAX_K)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return rag_federated(query, data.get("subjects"), use_cache=use_cache, k=k)
+
+        if ollama_llm is None:
+            ollama_llm = OllamaLLM(model_name="llama3.2")
+
+        subject_folder = os.path.join(UPLOAD_FOLDER, subject)
+        vector_store_file = os.path.join(subject_folder, "vector_store")
+
+        if not os.path.exists(vector_store_file):
+            return jsonify({"error": f"Vector store for '{subject}' not found."}), 404
+
+        timings = {}
+        vector_store, query_embedding, hits = retrieve_for_query(subject, vector_store_file, query, timings)
+        version = vector_store.stamp
+        retrieved_docs = [hit["doc"] for hit in hits]
+        reference_texts = [doc.page_content for doc in retrieved_docs]
+
+        # Reuse the answer to a near-identical question when there is one
+        cached = answer_cache.lookup(subject, version, query_embedding[0]) if use_cache else None
+        if cached is not None:
+            answer, similarity = cached
+        else:
+            # Run LLM for response on the documents retrieved above
+            with span("generate", timings):
+                prompt = PROMPT.format(context=build_context(retrieved_docs), question=query)
+                answer = llm_scheduler.invoke(ollama_llm, prompt, priority=PRIORITY_INTERACTIVE)
+            if use_cache:
+                answer_cache.store(subject, version, query_embedding[0], query, answer)
+
+        with span("render", timings):
+            response = {"answer": markdown.markdown(answer), "cached": cached is not None}
+            if cached is not None:
+                response["cacheSimilarity"] = round(similarity, 4)
+
+        if visualize:
+            with span("visualize", timings):
+                # Place the query into the cached corpus layout instead of re-running t-SNE;
+                # retrieved chunks already have a position in it
+                chunks = open_chunks(vector_store_file)
+                tsne_existing = corpus_layout(vector_store_file, chunks)
+                positions = [hit["position"] for hit in hits]
+                # Layout rows line up with index positions only if both come from the same save
+                if chunks.version == vector_store.stamp and len(tsne_existing) == vector_store.index.ntotal:
+                    tsne_reference = tsne_existing[positions]
+                else:
+                    tsne_reference = project_points(stored_vectors(vector_store, positions), chunks.embeddings, tsne_existing)
+                tsne_query = project_points(query_embedding, chunks.embeddings, tsne_existing)[0]
+
+                # Prepare t-SNE data
+                tsne_existing_data = [
+                    {"x": float(coord[0]), "y": float(coord[1]), "text": text}
+                    for coord, text in zip(tsne_existing, chunks.texts())
+                ]
+                tsne_reference_data = [
+                    {"x": float(coord[0]), "y": float(coord[1]), "text": text}
+                    for coord, text in zip(tsne_reference, reference_texts)
+                ]
+
+                response.update({
+                    "query_point": {
+                        "x": float(tsne_query[0]),
+                        "y": float(tsne_query[1]),
+                        "text": query
+                    },
+                    "existing_embeddings": tsne_existing_data,
+                    "reference_embeddings": tsne_reference_data
+                })
+
+        # Per-stage latency breakdown in milliseconds
+        response["timings"] = {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+        return jsonify(response), 200
+
+    except SchedulerQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        print(e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/stats', methods=['GET'])
+def cache_stats():
+    """Endpoint to report embedding model, vector store cache and chunk cache statistics."""
+    return jsonify({
+        "embedding_models": embedding_model_stats(),
+        "vector_stores": vector_stores.stats(),
+        "chunk_cache": chunk_cache.stats(),
+        "ingest_jobs": ingest_jobs.stats(),
+        "answer_cache": answer_cache.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "quiz_pool": quiz_pool.stats(),
+        "time_to_first_token": ttft_seconds.snapshot(),
+        "requests_in_flight": requests_in_flight.snapshot(),
+        "stages": stage_seconds.snapshot()
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Endpoint exposing request, stage, cache, index and LLM queue metrics in Prometheus text format."""
+    lines = []
+    for metric in (request_seconds, requests_in_flight, stage_seconds, ttft_seconds,
+                   llm_scheduler.wait_seconds, llm_scheduler.run_seconds):
+        lines.extend(metric.exposition())
+    lines.extend(stats_exposition("rag_vector_store_cache", vector_stores.stats(), {"memory": "subject"}))
+    lines.extend(stats_exposition("rag_chunk_cache", chunk_cache.stats()))
+    lines.extend(stats_exposition("rag_answer_cache", answer_cache.stats()))
+    lines.extend(stats_exposition("rag_ingest_jobs", ingest_jobs.stats(), {"jobs": "status"}))
+    lines.extend(stats_exposition("rag_llm_scheduler", llm_scheduler.stats(), {"queued_by_priority": "priority"}))
+    lines.extend(stats_exposition("rag_quiz_pool", quiz_pool.stats(), {"subjects": "subject"}))
+    models = [({"model": model["model_name"], "device": model["device"]}, model) for model in embedding_model_stats()]
+    lines.extend(stats_exposition("rag_embedding_model", models))
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/makedir", methods=["GET"])
 def make_directory():
     try:
@@ -336,104 +819,166 @@ def make_directory():
         return jsonify({"message": f"Directory created successfully for subject: {subject}"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+# Prompt used to generate multiple-choice questions from one chunk
+QUIZ_PROMPT = """
+You are an expert quiz generator. Generate exactly {num_questions} multiple-choice questions based on the following content.
+
+### Content:
+"{context}"
+
+### Instructions:
+- Each question must have exactly 4 answer choices.
+- Clearly indicate the correct answer in the options.
+- **Return only valid JSON (no extra text, no code blocks, no explanations).**
+- Ensure no newlines or special characters like tabs are included.
+
+Format:
+[
+    {{
+        "question": "What is the capital of France?",
+        "options": ["Paris", "London", "Berlin", "Madrid"],
+        "answer": "Paris"
+    }},
+    ...
+]
+"""
+
+
+class QuizFormatError(ValueError):
+    """Raised when the LLM response is not a usable quiz."""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+def generate_quiz_questions(context, num_questions, priority=PRIORITY_BACKGROUND):
+    """Ask the LLM for multiple-choice questions about one piece of content and return the valid ones."""
+    global quiz_llm
+    llm = ollama_llm
+    if llm is None:
+        # Background pool fills can run before /initialize; they get their own model
+        # instead of setting the one /initialize and /rag use
+        if quiz_llm is None:
+            quiz_llm = Ollama(model="llama3.2")
+        llm = quiz_llm
+
+    # Preprocess context to ensure better formatting
+    context = preprocess_text_for_quiz(context)
+    question_prompt = QUIZ_PROMPT.format(num_questions=num_questions, context=context)
+
+    # Get LLM response
+    response = llm_scheduler.invoke(llm, question_prompt, priority=priority).strip()
+    return parse_quiz(response)
+
+
+def parse_quiz(response):
+    """Parse and validate the LLM's quiz JSON, raising QuizFormatError if nothing usable is left."""
+    # Check if the response is empty or invalid
+    if not response:
+        raise QuizFormatError("LLM did not return a response")
+
+    # Clean up response (strip unwanted characters)
+    cleaned_response = response.replace("\n", " ").replace("\t", " ").replace("\r", " ").strip()
+
+    # Check for missing commas or common formatting issues
+    cleaned_response = fix_json_format(cleaned_response)
+
+    # Try parsing the cleaned response as JSON
+    try:
+        quiz = json.loads(cleaned_response)
+    except json.JSONDecodeError as e:
+        raise QuizFormatError("Invalid JSON format from LLM", f"Error: {e} - {cleaned_response}")
+    if not isinstance(quiz, list):
+        raise QuizFormatError("Generated quiz format is incorrect", cleaned_response)
+
+    # Convert answer indices to actual answer texts if necessary
+    for item in quiz:
+        if not isinstance(item, dict) or "answer" not in item or not isinstance(item.get("options"), list):
+            continue
+        if isinstance(item["answer"], int) or (isinstance(item["answer"], str) and item["answer"].isdigit()):
+            answer_index = int(item["answer"])  # Convert to integer
+            if 0 <= answer_index < len(item["options"]):  # Ensure index is valid
+                item["answer"] = item["options"][answer_index]  # Replace index with actual text
+
+    # Validate the quiz structure
+    valid_quiz = [
+        item for item in quiz if isinstance(item, dict) and
+        all(k in item for k in ["question", "options", "answer"]) and
+        isinstance(item["options"], list) and len(item["options"]) == 4 and
+        item["answer"] in item["options"]
+    ]
+
+    if not valid_quiz:
+        raise QuizFormatError("Generated quiz format is incorrect", cleaned_response)
+    return valid_quiz
+
+
+# Pre-generated questions per subject, built after each ingest
+quiz_pool = QuizPool(generate_quiz_questions)
+
+
 @app.route('/generate_quiz', methods=['POST'])
 def generate_quiz():
     """Generate a quiz based on the subject."""
     data = request.get_json()
     subject = data.get("subject")
-    num_questions = data.get("num_questions", 10)  # Default to 10 if not provided
 
     if not subject:
         return jsonify({"error": "Subject is required"}), 400
-
     try:
-        if ollama_llm is None:
-            return jsonify({"error": "Ollama model is not initialized. Please initialize the model first."}), 500
+        num_questions = int(data.get("num_questions", 10))  # Default to 10 if not provided
+    except (TypeError, ValueError):
+        return jsonify({"error": "num_questions must be an integer"}), 400
+    if not 1 <= num_questions <= QUIZ_MAX_QUESTIONS:
+        return jsonify({"error": f"num_questions must be between 1 and {QUIZ_MAX_QUESTIONS}"}), 400
 
+    try:
         subject_folder = os.path.join(UPLOAD_FOLDER, subject)
         vector_store_file = os.path.join(subject_folder, "vector_store")
 
         if not os.path.exists(vector_store_file):
             return jsonify({"error": f"No data available for the subject '{subject}'."}), 400
 
-        embedding_model = HuggingFaceEmbeddings(model_name='all-MiniLM-L6-v2')
-        vector_store = FAISS.load_local(vector_store_file, embedding_model, allow_dangerous_deserialization=True)
+        # The pool is filled by its own model; the one /initialize sets up is only needed to cover a shortfall
+        if ollama_llm is None and quiz_pool.available(subject, vector_store_file) < num_questions:
+            return jsonify({"error": "Ollama model is not initialized. Please initialize the model first."}), 500
+
+        with span("load_index"):
+            vector_store = vector_stores.get(subject, vector_store_file)
 
         if vector_store.index.ntotal == 0:
             return jsonify({"error": "No vectors found in FAISS. Please upload content first."}), 400
 
-        retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-        query = f"Key concepts of {subject}"
-        result = retriever.invoke(query)
-        context = result[0].page_content if result else "No relevant content found."
-
-        # Preprocess context to ensure better formatting
-        context = preprocess_text_for_quiz(context)
-
-        # Updated prompt to generate strictly formatted JSON
-        question_prompt = f"""
-        You are an expert quiz generator. Generate exactly {num_questions} multiple-choice questions based on the following content.
-
-        ### Content:
-        "{context}"
-
-        ### Instructions:
-        - Each question must have exactly 4 answer choices.
-        - Clearly indicate the correct answer in the options.
-        - **Return only valid JSON (no extra text, no code blocks, no explanations).**
-        - Ensure no newlines or special characters like tabs are included.
-
-        Format:
-        [
-            {{
-                "question": "What is the capital of France?",
-                "options": ["Paris", "London", "Berlin", "Madrid"],
-                "answer": "Paris"
-            }},
-            ...
-        ]
-        """
-
-        # Get LLM response
-        response = ollama_llm.invoke(question_prompt).strip()
-
-        # Check if the response is empty or invalid
-        if not response:
-            return jsonify({"error": "LLM did not return a response"}), 500
-
-        # Clean up response (strip unwanted characters)
-        cleaned_response = response.replace("\n", " ").replace("\t", " ").replace("\r", " ").strip()
-
-        # Check for missing commas or common formatting issues
-        cleaned_response = fix_json_format(cleaned_response)
-
-        # Try parsing the cleaned response as JSON
-        try:
-            quiz = json.loads(cleaned_response)
-
-            # Convert answer indices to actual answer texts if necessary
-            for item in quiz:
-                if isinstance(item["answer"], int) or (isinstance(item["answer"], str) and item["answer"].isdigit()):
-                    answer_index = int(item["answer"])  # Convert to integer
-                    if 0 <= answer_index < len(item["options"]):  # Ensure index is valid
-                        item["answer"] = item["options"][answer_index]  # Replace index with actual text
-
-            # Validate the quiz structure
-            valid_quiz = [
-                item for item in quiz if isinstance(item, dict) and
-                all(k in item for k in ["question", "options", "answer"]) and
-                isinstance(item["options"], list) and len(item["options"]) == 4 and
-                item["answer"] in item["options"]
-            ]
-
-            if not valid_quiz:
-                return jsonify({"error": "Generated quiz format is incorrect", "details": cleaned_response}), 500
-
-            return jsonify({"quiz": valid_quiz}), 200
-
-        except json.JSONDecodeError as e:
-            return jsonify({"error": "Invalid JSON format from LLM", "details": f"Error: {e} - {cleaned_response}"}), 500
-
+        # Serve from the pre-generated pool; it is topped up in the background as it drains
+        with span("pool"):
+            quiz = quiz_pool.take(subject, vector_store_file, num_questions)
+        source = "pool"
+        if len(quiz) < num_questions:
+            # Pool empty or short: generate the rest in parallel from chunks retrieved for the subject.
+            # The candidates are drawn at random from a wider set of hits, so students asking at the
+            # same time are not all quizzed on the same few chunks
+            candidates = 2 * math.ceil(num_questions / QUIZ_POOL_QUESTIONS_PER_CHUNK)
+            _, _, hits = retrieve_for_query(subject, vector_store_file, f"Key concepts of {subject}", {}, k=4 * candidates)
+            hits = random.sample(hits, len(hits))
+            with span("generate"):
+                generated = generate_from_chunks(
+                    lambda text, count: generate_quiz_questions(text, count, priority=PRIORITY_QUIZ),
+                    [hit["doc"].page_content for hit in hits],
+                    num_questions - len(quiz),
+                    exclude=quiz
+                )
+            source = "pool+generated" if quiz else "generated"
+            quiz = quiz + generated
+
+        return jsonify({"quiz": quiz, "source": source, "poolRemaining": quiz_pool.remaining(subject)}), 200
+
+    except QuizFormatError as e:
+        return jsonify({"error": str(e), "details": e.details}), 500
+    except SchedulerQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -461,4 +1006,5 @@ def fix_json_format(response):
     return response
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # Run as a script, this module would be re-imported by every spawned PDF parser process
+    sys.exit("Start the RAG service with: python server.py")
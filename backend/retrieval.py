@@ -0,0 +1,60 @@
+import heapq
+import numpy as np
+
+
+def search(vector_store, query_vectors, k):
+    """
+    Search a FAISS vector store with precomputed query vectors.
+    Returns one list per query of hits {"doc", "score", "position"}, best first;
+    `position` is the row of the hit in the index (and in the subject's chunk store).
+    """
+    vectors = np.asarray(query_vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    k = min(k, vector_store.index.ntotal)
+    if k == 0:
+        return [[] for _ in range(len(vectors))]
+
+    scores, indices = vector_store.index.search(vectors, k)
+    results = []
+    for query_scores, query_indices in zip(scores, indices):
+        hits = []
+        for score, position in zip(query_scores, query_indices):
+            if position == -1:
+                # Fewer than k vectors matched
+                continue
+            doc_id = vector_store.index_to_docstore_id[int(position)]
+            hits.append({"doc": vector_store.docstore.search(doc_id), "score": float(score), "position": int(position)})
+        results.append(hits)
+    return results
+
+
+def merge_hits(shard_hits, k):
+    """
+    Merge per-shard hit lists (each best first, as returned by `search`) into the overall top k.
+    `shard_hits` is {shard name: hits}; every merged hit is tagged with its "shard".
+    Scores are L2 distances from the same embedding model, so they compare across shards.
+    A chunk whose text already appeared in another shard (the same PDF in two subjects) is skipped.
+    """
+    tagged = [[dict(hit, shard=name) for hit in hits] for name, hits in shard_hits.items()]
+    merged, seen = [], set()
+    for hit in heapq.merge(*tagged, key=lambda hit: hit["score"]):
+        if hit["doc"].page_content in seen:
+            continue
+        seen.add(hit["doc"].page_content)
+        merged.append(hit)
+        if len(merged) == k:
+            break
+    return merged
+
+
+def stored_vectors(vector_store, positions):
+    """Return the vectors stored in the index at the given positions, without re-embedding."""
+    if not positions:
+        return np.zeros((0, vector_store.index.d), dtype=np.float32)
+    return np.vstack([vector_store.index.reconstruct(position) for position in positions])
+
+
+def build_context(docs):
+    """Join retrieved chunks the way the 'stuff' chain does."""
+    return "\n\n".join(doc.page_content for doc in docs)
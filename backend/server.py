@@ -0,0 +1,11 @@
+"""
+Entry point for the RAG service: python server.py
+
+The app is imported inside the __main__ guard. PDF parser processes are started with
+"spawn" and re-import the main module, so they load this file (and pdf_parser) only,
+not the Flask app, the models and their thread pools.
+"""
+
+if __name__ == '__main__':
+    from rag_pipeline import app
+    app.run(debug=True, port=5000)
@@ -0,0 +1,79 @@
+import gc
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """Stand-in for a pymysql connection."""
+
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        if self.closed:
+            raise ConnectionError("closed")
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self):
+        return None
+
+
+def make_pool(max_size=3):
+    return ConnectionPool(FakeConnection, min_size=0, max_size=max_size, timeout=0.2)
+
+
+def test_with_block_returns_connection_when_handler_fails():
+    pool = make_pool()
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            with pool.get():
+                raise ValueError("duplicate email")
+    assert pool.stats()["in_use"] == 0
+    assert pool.stats()["created"] == 1
+
+
+def test_dropped_connection_is_reclaimed():
+    pool = make_pool()
+    for _ in range(5):
+        conn = pool.get()
+        conn.cursor()
+        del conn  # A handler that returned early without conn.close()
+        gc.collect()
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["reclaimed"] == 5
+    with pool.get():
+        pass
+
+
+def test_exhausted_pool_times_out():
+    pool = make_pool(max_size=1)
+    with pool.get():
+        with pytest.raises(PoolTimeout):
+            pool.get()
+    with pool.get():
+        pass
+
+
+def test_close_is_idempotent_and_rolls_back():
+    pool = make_pool()
+    conn = pool.get()
+    raw = conn._connection
+    conn.close()
+    conn.close()
+    assert raw.rollbacks == 1
+    assert pool.stats()["idle"] == 1
+    with pytest.raises(RuntimeError):
+        conn.cursor()
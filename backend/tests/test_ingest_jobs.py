@@ -0,0 +1,47 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ingest_jobs import IngestJobQueue
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_jobs_for_a_running_subject_are_held_and_merged():
+    release = threading.Event()
+    ran = []
+
+    def handler(job):
+        ran.append((job.subject, list(job.file_paths)))
+        if job.subject == "s" and len(ran) == 1:
+            release.wait(5)
+        return {}
+
+    jobs = IngestJobQueue(handler, workers=2)
+    first = jobs.submit("s", ["a.pdf"])
+    wait_for(lambda: first.status == "running")
+
+    second = jobs.submit("s", ["a.pdf", "b.pdf"])
+    third = jobs.submit("s", ["a.pdf", "b.pdf", "c.pdf"])
+    assert third is second
+    assert second.submissions == 2
+
+    # The idle worker serves another subject instead of waiting on "s"
+    other = jobs.submit("t", ["x.pdf"])
+    wait_for(lambda: other.status == "done")
+    assert second.status == "queued"
+
+    release.set()
+    wait_for(lambda: second.status == "done")
+    assert first.status == "done"
+    assert [paths for subject, paths in ran if subject == "s"] == [["a.pdf"], ["a.pdf", "b.pdf", "c.pdf"]]
+    assert jobs.stats()["queued"] == 0
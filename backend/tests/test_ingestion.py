@@ -0,0 +1,215 @@
+import hashlib
+import os
+import sys
+
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ann_index
+import chunk_store
+import ingestion
+import vector_store_cache
+from chunk_store import open_chunks
+from langchain_community.vectorstores import FAISS
+
+DIMENSION = 8
+
+
+def fake_chunk_and_embed(files, embedding_model=None, timings=None, progress=None):
+    """One chunk per line of a text file, with an embedding derived from the line."""
+    results = []
+    for file_path, _ in files:
+        with open(file_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        chunks = [Document(page_content=line, metadata={"source": file_path}) for line in lines]
+        embeddings = np.array([
+            np.random.default_rng(int(hashlib.sha256(line.encode()).hexdigest()[:8], 16)).standard_normal(DIMENSION)
+            for line in lines
+        ], dtype=np.float32).reshape(len(lines), DIMENSION)
+        results.append((chunks, embeddings))
+    return results
+
+
+@pytest.fixture
+def subject(tmp_path, monkeypatch):
+    embedding_model = DeterministicFakeEmbedding(size=DIMENSION)
+    monkeypatch.setattr(ingestion, "get_embedding_model", lambda: embedding_model)
+    monkeypatch.setattr(vector_store_cache, "get_embedding_model", lambda: embedding_model)
+    monkeypatch.setattr(chunk_store, "get_embedding_model", lambda: embedding_model)
+    monkeypatch.setattr(ingestion, "chunk_and_embed", fake_chunk_and_embed)
+    monkeypatch.setattr(ingestion, "INGEST_PROCESSES", 1)
+    builds = []
+    build_index = ingestion.build_index
+    monkeypatch.setattr(ingestion, "build_index", lambda *args, **kwargs: builds.append(args[1:]) or build_index(*args, **kwargs))
+
+    def write(name, lines):
+        file_path = str(tmp_path / name)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(f"{name} line {i}" for i in range(lines)))
+        return file_path
+
+    subject = type("Subject", (), {})()
+    subject.embedding_model = embedding_model
+    subject.path = str(tmp_path / "vector_store")
+    subject.write = write
+    subject.builds = builds
+    return subject
+
+
+def assert_consistent(vector_store_path):
+    """The saved index, docstore mapping and chunk store agree row by row."""
+    store = vector_store_cache.load_vector_store(vector_store_path)
+    chunks = open_chunks(vector_store_path)
+    assert store.index.ntotal == len(chunks)
+    assert [store.index_to_docstore_id[i] for i in range(len(chunks))] == [doc.id for doc in chunks.documents()]
+    vectors = np.array([store.index.reconstruct(i) for i in range(len(chunks))])
+    np.testing.assert_allclose(vectors, chunks.embeddings, atol=1e-5)
+    return store
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf_flat"])
+def test_added_files_go_into_the_existing_index(subject, monkeypatch, index_type):
+    monkeypatch.setattr(ann_index, "ANN_INDEX_TYPE", index_type)
+    monkeypatch.setattr(ann_index, "ANN_NLIST", 2)
+    a, b = subject.write("a.txt", 100), subject.write("b.txt", 30)
+    ingestion.update_subject_index([a], subject.path)
+    assert len(subject.builds) == 1
+
+    ingestion.update_subject_index([a, b], subject.path)
+    store = assert_consistent(subject.path)
+    assert ann_index.index_type_of(store.index) == index_type
+    assert store.index.ntotal == 130
+    assert len(subject.builds) == 1
+
+
+def test_ivf_removes_without_retraining(subject, monkeypatch):
+    monkeypatch.setattr(ann_index, "ANN_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setattr(ann_index, "ANN_NLIST", 2)
+    a, b = subject.write("a.txt", 100), subject.write("b.txt", 30)
+    ingestion.update_subject_index([a, b], subject.path)
+    store = vector_store_cache.load_vector_store(subject.path)
+    centroids = faiss.downcast_index(store.index.quantizer).reconstruct_n(0, 2)
+
+    store, removed = ingestion.remove_document(b, subject.path)
+    assert removed
+    assert len(subject.builds) == 1
+    store = assert_consistent(subject.path)
+    assert store.index.ntotal == 100
+    np.testing.assert_array_equal(faiss.downcast_index(store.index.quantizer).reconstruct_n(0, 2), centroids)
+
+
+def test_hnsw_is_rebuilt_after_removal(subject, monkeypatch):
+    monkeypatch.setattr(ann_index, "ANN_INDEX_TYPE", "hnsw")
+    a, b = subject.write("a.txt", 20), subject.write("b.txt", 10)
+    ingestion.update_subject_index([a, b], subject.path)
+    ingestion.update_subject_index([a], subject.path)
+    store = assert_consistent(subject.path)
+    assert ann_index.index_type_of(store.index) == "hnsw"
+    assert len(subject.builds) == 3  # Initial build, flat copy of the kept vectors, rebuild
+
+
+def test_index_is_rebuilt_when_the_corpus_changes_tier(subject, monkeypatch):
+    monkeypatch.setattr(ann_index, "ANN_FLAT_MAX", 50)
+    a, b = subject.write("a.txt", 40), subject.write("b.txt", 20)
+    ingestion.update_subject_index([a], subject.path)
+    assert ann_index.index_type_of(vector_store_cache.load_vector_store(subject.path).index) == "flat"
+
+    ingestion.update_subject_index([a, b], subject.path)
+    assert ann_index.index_type_of(assert_consistent(subject.path).index) == "hnsw"
+
+    ingestion.update_subject_index([b], subject.path)
+    assert ann_index.index_type_of(assert_consistent(subject.path).index) == "flat"
+
+
+def manifest_ids(vector_store_path):
+    return {os.path.basename(document["path"]): document["ids"] for document in ingestion.load_manifest(vector_store_path).values()}
+
+
+def test_new_unchanged_modified_and_deleted_files(subject):
+    a, b, c = subject.write("a.txt", 5), subject.write("b.txt", 3), subject.write("c.txt", 4)
+    store, summary = ingestion.update_subject_index([a, b], subject.path)
+    assert sorted(summary["added"]) == [a, b]
+    assert store.index.ntotal == 8
+    ids = manifest_ids(subject.path)
+    assert_consistent(subject.path)
+
+    # Nothing changed: nothing is re-indexed
+    store, summary = ingestion.update_subject_index([a, b], subject.path)
+    assert store is None
+    assert not summary["changed"]
+    assert sorted(summary["unchanged"]) == [a, b]
+
+    # b modified, c added, a untouched
+    subject.write("b.txt", 6)
+    store, summary = ingestion.update_subject_index([a, b, c], subject.path)
+    assert sorted(summary["added"]) == [b, c]
+    assert summary["unchanged"] == [a]
+    assert summary["removed"] == []
+    assert store.index.ntotal == 15
+    updated = manifest_ids(subject.path)
+    assert updated["a.txt"] == ids["a.txt"]
+    assert updated["b.txt"] != ids["b.txt"] and len(updated["b.txt"]) == 6
+    assert_consistent(subject.path)
+
+    # a no longer listed
+    store, summary = ingestion.update_subject_index([b, c], subject.path)
+    assert summary["removed"] == [a]
+    assert store.index.ntotal == 10
+    assert sorted(manifest_ids(subject.path)) == ["b.txt", "c.txt"]
+    store = assert_consistent(subject.path)
+    assert not any(doc.metadata["source"] == a for doc in store.docstore._dict.values())
+
+
+def test_chunk_ids_are_deterministic(subject, tmp_path):
+    a = subject.write("a.txt", 4)
+    ingestion.update_subject_index([a], subject.path)
+    other_path = str(tmp_path / "other_store")
+    ingestion.update_subject_index([a], other_path)
+    assert manifest_ids(subject.path) == manifest_ids(other_path)
+
+
+def test_remove_document(subject):
+    a, b = subject.write("a.txt", 5), subject.write("b.txt", 3)
+    ingestion.update_subject_index([a, b], subject.path)
+
+    store, removed = ingestion.remove_document(a, subject.path)
+    assert removed
+    assert store.index.ntotal == 3
+    assert sorted(manifest_ids(subject.path)) == ["b.txt"]
+    assert_consistent(subject.path)
+
+    store, removed = ingestion.remove_document(a, subject.path)
+    assert not removed
+
+    store, removed = ingestion.remove_document(b, subject.path)
+    assert removed
+    assert store is None
+    assert not os.path.exists(subject.path)
+
+
+def test_legacy_store_without_manifest_is_reindexed_once(subject):
+    a, b = subject.write("a.txt", 5), subject.write("b.txt", 3)
+
+    # A store saved by FAISS.save_local before chunks and manifests were persisted
+    chunks, embeddings = fake_chunk_and_embed([(a, None)])[0]
+    legacy = FAISS.from_embeddings(
+        zip([chunk.page_content for chunk in chunks], embeddings),
+        subject.embedding_model,
+        metadatas=[chunk.metadata for chunk in chunks],
+    )
+    legacy.save_local(subject.path)
+    assert ingestion.load_manifest(subject.path)[ingestion.document_key(a)]["sha256"] is None
+
+    # The legacy chunks of a are replaced, not duplicated
+    store, summary = ingestion.update_subject_index([a, b], subject.path)
+    assert sorted(summary["added"]) == [a, b]
+    assert store.index.ntotal == 8
+    assert_consistent(subject.path)
+
+    store, summary = ingestion.update_subject_index([a, b], subject.path)
+    assert not summary["changed"]
@@ -0,0 +1,132 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark import StubLLM
+from llm_scheduler import (
+    LLMScheduler, SchedulerQueueFull, PRIORITY_INTERACTIVE, PRIORITY_QUIZ, PRIORITY_BATCH, PRIORITY_BACKGROUND
+)
+
+
+def occupy(scheduler):
+    """Keep the scheduler's only worker busy until the returned event is set."""
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    scheduler.submit(block)
+    started.wait(5)
+    return release
+
+
+def test_waiting_requests_run_by_priority_then_arrival():
+    scheduler = LLMScheduler(concurrency=1)
+    release = occupy(scheduler)
+    order = []
+    futures = [
+        scheduler.submit(order.append, name, priority=priority)
+        for name, priority in [
+            ("background", PRIORITY_BACKGROUND),
+            ("batch", PRIORITY_BATCH),
+            ("first interactive", PRIORITY_INTERACTIVE),
+            ("quiz", PRIORITY_QUIZ),
+            ("second interactive", PRIORITY_INTERACTIVE),
+        ]
+    ]
+    assert scheduler.stats()["queued_by_priority"] == {10: 1, 5: 1, 0: 2, 3: 1}
+
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["first interactive", "second interactive", "quiz", "batch", "background"]
+
+
+def test_identical_prompts_share_one_generation():
+    scheduler = LLMScheduler(concurrency=2)
+    llm = StubLLM(latency=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.invoke(llm, "same prompt"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert llm.calls == 1
+    assert results == ["Answer to: same prompt"] * 4
+    assert scheduler.stats()["coalesced"] == 3
+    assert scheduler.invoke(llm, "other prompt") == "Answer to: other prompt"
+    assert llm.calls == 2
+
+
+def test_concurrency_is_bounded():
+    scheduler = LLMScheduler(concurrency=2)
+    llm = StubLLM(latency=0.05)
+    futures = [scheduler.submit(llm.invoke, f"prompt {i}") for i in range(8)]
+    for future in futures:
+        future.result(timeout=5)
+    assert llm.peak_active == 2
+
+
+def test_timeout_cancels_a_queued_request():
+    scheduler = LLMScheduler(concurrency=1)
+    release = occupy(scheduler)
+    llm = StubLLM(latency=0)
+
+    with pytest.raises(TimeoutError):
+        scheduler.invoke(llm, "never runs", timeout=0.05)
+    release.set()
+    scheduler.invoke(llm, "runs")
+
+    stats = scheduler.stats()
+    assert stats["timeouts"] == 1
+    assert stats["cancelled"] == 1
+    assert llm.calls == 1
+
+
+def test_cancel_waits_for_every_coalesced_caller():
+    scheduler = LLMScheduler(concurrency=1)
+    release = occupy(scheduler)
+    calls = []
+    first = scheduler.submit(calls.append, "x", key="shared")
+    second = scheduler.submit(calls.append, "x", key="shared")
+    assert first is second
+
+    scheduler.cancel(first)
+    assert not first.cancelled()
+    scheduler.cancel(second)
+    assert first.cancelled()
+
+    release.set()
+    scheduler.submit(calls.append, "y").result(timeout=5)
+    assert calls == ["y"]
+
+
+def test_full_queue_rejects_requests():
+    scheduler = LLMScheduler(concurrency=1, max_queue=1)
+    release = occupy(scheduler)
+    scheduler.submit(time.sleep, 0)
+    with pytest.raises(SchedulerQueueFull):
+        scheduler.submit(time.sleep, 0)
+    release.set()
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_stream_yields_tokens_and_stops_when_closed():
+    scheduler = LLMScheduler(concurrency=1)
+    llm = StubLLM(latency=0.05)
+    assert "".join(scheduler.stream(llm, "hello there")) == "Answer to: hello there"
+
+    tokens = scheduler.stream(llm, "another prompt")
+    assert next(tokens) == "Answer "
+    tokens.close()
+    # The worker is free again once the closed stream notices it was stopped
+    assert scheduler.invoke(llm, "after", timeout=5) == "Answer to: after"
@@ -0,0 +1,43 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from passwords import PasswordHasher, HasherBusy, HasherTimeout
+
+
+def test_timeout_keeps_slot_until_operation_finishes():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, timeout=0.05)
+    release = threading.Event()
+    finished = threading.Event()
+
+    def slow():
+        release.wait(5)
+        finished.set()
+        return "done"
+
+    with pytest.raises(HasherTimeout):
+        hasher._run(slow)
+    assert hasher.stats()["timed_out"] == 1
+
+    # The timed-out operation is still running, so its slot is not free yet
+    with pytest.raises(HasherBusy):
+        hasher._run(lambda: "next")
+    assert hasher.stats()["rejected"] == 1
+
+    release.set()
+    finished.wait(5)
+    hasher._executor.shutdown(wait=True)
+    assert hasher.stats()["pending"] == 0
+    assert hasher._slots.acquire(blocking=False)
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=2)
+    hashed = hasher.hash("secret")
+    assert hasher.verify("secret", hashed)
+    assert not hasher.verify("wrong", hashed)
+    assert hasher.stats()["pending"] == 0
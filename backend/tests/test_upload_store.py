@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from upload_store import HashingUpload, UploadTooLarge, format_size
+
+
+@pytest.mark.parametrize("n_bytes, text", [
+    (100, "100 bytes"),
+    (512 * 1024, "512 KiB"),
+    (1536 * 1024, "1.5 MiB"),
+    (100 * 1024 * 1024, "100 MiB"),
+])
+def test_format_size(n_bytes, text):
+    assert format_size(n_bytes) == text
+
+
+def test_small_limit_is_reported_in_the_error(tmp_path):
+    upload = HashingUpload(folder=str(tmp_path), max_bytes=512 * 1024)
+    with pytest.raises(UploadTooLarge, match="512 KiB upload limit"):
+        upload.write(b"x" * (512 * 1024 + 1))
+    assert os.listdir(tmp_path) == []
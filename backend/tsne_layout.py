@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import numpy as np
+from sklearn.manifold import TSNE
+from chunk_store import chunk_store_version
+
+# 2-D t-SNE layout of a subject's chunks, saved next to its index
+LAYOUT_FILE = "tsne_layout.npy"
+LAYOUT_VERSION_FILE = "tsne_layout.json"
+
+# Neighbours used to place a new point (query, references) into an existing layout
+PROJECTION_NEIGHBOURS = 5
+
+# Layouts loaded in this process, keyed by vector store path
+_layouts = {}
+_locks = {}
+_lock = threading.Lock()
+
+
+def compute_layout(embeddings):
+    """Run t-SNE over a subject's chunk embeddings."""
+    n_samples = len(embeddings)
+    if n_samples < 3:
+        # t-SNE needs a few points; lay tiny corpora out on a line
+        return np.array([[float(i), 0.0] for i in range(n_samples)], dtype=np.float32)
+    perplexity = min(30, n_samples - 1)
+    tsne = TSNE(n_components=2, perplexity=perplexity, random_state=42)
+    return tsne.fit_transform(np.asarray(embeddings, dtype=np.float32)).astype(np.float32)
+
+
+def _read_saved_layout(vector_store_path, version):
+    try:
+        with open(os.path.join(vector_store_path, LAYOUT_VERSION_FILE), encoding="utf-8") as f:
+            if json.load(f).get("version") != version:
+                return None
+        return np.load(os.path.join(vector_store_path, LAYOUT_FILE))
+    except (OSError, ValueError):
+        return None
+
+
+def _save_layout(vector_store_path, version, layout):
+    layout_tmp = os.path.join(vector_store_path, LAYOUT_FILE + ".tmp")
+    with open(layout_tmp, "wb") as f:
+        np.save(f, layout)
+    # Drop the old version first, so a reader never pairs it with the new layout
+    version_file = os.path.join(vector_store_path, LAYOUT_VERSION_FILE)
+    if os.path.exists(version_file):
+        os.remove(version_file)
+    os.replace(layout_tmp, os.path.join(vector_store_path, LAYOUT_FILE))
+    with open(version_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": version}, f)
+    os.replace(version_file + ".tmp", version_file)
+
+
+def corpus_layout(vector_store_path, chunks):
+    """
+    Return the 2-D layout of a subject's chunks, computing it at most once per index version.
+    The layout is cached in memory and on disk, so restarts and other workers reuse it.
+    Rows follow `chunks`, keyed by the version they were opened at.
+    """
+    version = chunks.version or chunk_store_version(vector_store_path)
+    with _lock:
+        entry = _layouts.get(vector_store_path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        path_lock = _locks.setdefault(vector_store_path, threading.Lock())
+
+    with path_lock:
+        with _lock:
+            entry = _layouts.get(vector_store_path)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+        layout = _read_saved_layout(vector_store_path, version)
+        if layout is None or len(layout) != len(chunks):
+            layout = compute_layout(chunks.embeddings)
+            _save_layout(vector_store_path, version, layout)
+
+        with _lock:
+            _layouts[vector_store_path] = (version, layout)
+        return layout
+
+
+def invalidate_layout(vector_store_path):
+    """Forget a subject's layout in memory and on disk, so the next corpus_layout call recomputes it."""
+    with _lock:
+        _layouts.pop(vector_store_path, None)
+    for name in (LAYOUT_VERSION_FILE, LAYOUT_FILE):
+        try:
+            os.remove(os.path.join(vector_store_path, name))
+        except OSError:
+            pass
+
+
+def project_points(vectors, corpus_embeddings, layout, k=PROJECTION_NEIGHBOURS):
+    """
+    Place new vectors into an existing layout without re-running t-SNE.
+    Each point lands at the inverse-distance weighted mean of its k nearest chunks' coordinates,
+    so a vector identical to a chunk lands exactly on that chunk.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    corpus = np.asarray(corpus_embeddings, dtype=np.float32)
+    if len(vectors) == 0 or len(corpus) == 0:
+        return np.zeros((len(vectors), 2), dtype=np.float32)
+
+    k = min(k, len(corpus))
+    # Squared L2 distances between every new vector and every chunk
+    distances = (
+        np.sum(vectors ** 2, axis=1, keepdims=True)
+        - 2 * vectors @ corpus.T
+        + np.sum(corpus ** 2, axis=1)
+    )
+    distances = np.maximum(distances, 0)
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+
+    weights = 1.0 / (nearest_distances + 1e-9)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum("nk,nkd->nd", weights, layout[nearest]).astype(np.float32)
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import tempfile
+import threading
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from config import UPLOAD_MAX_BYTES, UPLOAD_MAX_REQUEST_BYTES, UPLOAD_BLOCK_SIZE, UPLOAD_EXTENSIONS, UPLOAD_TMP_FOLDER
+
+# sha256 of files already in upload folders, keyed by path and checked against size and mtime
+_digests = {}
+_lock = threading.Lock()
+_store_lock = threading.Lock()
+
+
+def format_size(n_bytes):
+    """Human-readable size for limit messages: "100 MiB", "1.5 MiB", "512 KiB" or "100 bytes"."""
+    for unit, size in (("GiB", 1024 ** 3), ("MiB", 1024 ** 2), ("KiB", 1024)):
+        if n_bytes >= size:
+            return f"{n_bytes / size:.1f}".rstrip("0").rstrip(".") + f" {unit}"
+    return f"{n_bytes} bytes"
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    """Raised while streaming a file that is larger than UPLOAD_MAX_BYTES."""
+
+
+class HashingUpload:
+    """
+    Writable temporary file for one uploaded file part. Data is hashed and counted as
+    it is written, so the upload is rejected as soon as it passes `max_bytes` and its
+    sha256 is known once the last block arrives, without reading the file again.
+    """
+
+    def __init__(self, folder=UPLOAD_TMP_FOLDER, max_bytes=UPLOAD_MAX_BYTES, block_size=UPLOAD_BLOCK_SIZE):
+        os.makedirs(folder, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=folder, suffix=".part")
+        self._file = os.fdopen(fd, "w+b", buffering=block_size)
+        self._digest = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.done = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.discard()
+            raise UploadTooLarge(f"File is larger than the {format_size(self.max_bytes)} upload limit")
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    # Werkzeug rewinds the stream once the part is complete and may read it back
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def flush(self):
+        self._file.flush()
+
+    def commit(self, destination):
+        """Durably write the file and atomically rename it to `destination`."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path, destination)
+        self.done = True
+
+    def discard(self):
+        """Close and delete the temporary file, unless it was committed."""
+        if self.done:
+            return
+        self.done = True
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        self.discard()
+
+
+class UploadRequest(Request):
+    """
+    Flask request class that streams file parts straight into HashingUpload files
+    instead of spooling them to anonymous temporary files first. Parts that are
+    never committed are deleted when the request is closed.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and not filename.lower().endswith(UPLOAD_EXTENSIONS):
+            raise UnsupportedMediaType(f"Only {', '.join(UPLOAD_EXTENSIONS)} files can be uploaded")
+        if content_length is not None and content_length > UPLOAD_MAX_BYTES:
+            raise UploadTooLarge(f"File is larger than the {format_size(UPLOAD_MAX_BYTES)} upload limit")
+        upload = HashingUpload()
+        self.__dict__.setdefault("_uploads", []).append(upload)
+        return upload
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            for upload in self.__dict__.get("_uploads", []):
+                upload.discard()
+
+
+def file_digest(file_path):
+    """sha256 of a file on disk, hashed in fixed-size blocks and cached until the file changes."""
+    stat = os.stat(file_path)
+    with _lock:
+        cached = _digests.get(file_path)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_BLOCK_SIZE), b""):
+            digest.update(block)
+    with _lock:
+        _digests[file_path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def find_duplicate(folder, sha256, size):
+    """Return the path of a file in `folder` with this content, or None. Only files of the same size are hashed."""
+    if not os.path.isdir(folder):
+        return None
+    for name in sorted(os.listdir(folder)):
+        file_path = os.path.join(folder, name)
+        if os.path.isfile(file_path) and os.path.getsize(file_path) == size and file_digest(file_path) == sha256:
+            return file_path
+    return None
+
+
+def store_upload(file, folder, file_name, replace=False):
+    """
+    Move a streamed upload into `folder` under `file_name`.
+    An upload whose content is already in the folder is dropped and the existing file
+    is returned instead (duplicate=True). A different file with the same name is only
+    overwritten with replace=True; otherwise FileExistsError is raised.
+    Returns {"fileName", "filePath", "documentId" (the content sha256), "size", "duplicate"}.
+    """
+    upload = file.stream
+    if not isinstance(upload, HashingUpload):
+        raise TypeError("store_upload needs a request parsed by UploadRequest")
+    sha256, size = upload.sha256(), upload.size
+    os.makedirs(folder, exist_ok=True)
+    file_path = os.path.join(folder, file_name)
+
+    # Checking for duplicates and renaming into place happen under one lock,
+    # so two concurrent uploads of the same content cannot both be stored
+    with _store_lock:
+        duplicate = find_duplicate(folder, sha256, size)
+        if duplicate is not None:
+            upload.discard()
+            return {
+                "fileName": os.path.basename(duplicate),
+                "filePath": duplicate,
+                "documentId": sha256,
+                "size": size,
+                "duplicate": True,
+            }
+
+        if os.path.exists(file_path) and not replace:
+            upload.discard()
+            raise FileExistsError(f"A different file named '{file_name}' already exists")
+
+        upload.commit(file_path)
+        stat = os.stat(file_path)
+        with _lock:
+            _digests[file_path] = (stat.st_size, stat.st_mtime_ns, sha256)
+    return {"fileName": file_name, "filePath": file_path, "documentId": sha256, "size": size, "duplicate": False}
@@ -0,0 +1,220 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from embedding_registry import get_embedding_model
+from chunk_store import open_chunks, read_stamp, write_stamp, INDEX_STAMP_FILE, PENDING_STAMP, STAMP_WAIT_SECONDS
+from ann_index import configure_search, index_type_of, index_quantization_of
+from metrics import record_stage
+from config import VECTOR_CACHE_MAX_SUBJECTS, VECTOR_CACHE_MAX_BYTES
+
+INDEX_FILES = ("index.faiss", "index.pkl")
+
+
+def index_version(vector_store_path):
+    """
+    Return a version string for the vector store saved at the given path.
+    It changes whenever /chunk rewrites the index, so stale cache entries can be detected:
+    the stamp shared with the chunk store, or file sizes and times for unstamped stores.
+    Returns None if the vector store does not exist.
+    """
+    stamp = read_stamp(vector_store_path, INDEX_STAMP_FILE)
+    if stamp is not None and os.path.exists(os.path.join(vector_store_path, INDEX_FILES[0])):
+        return stamp
+    parts = []
+    for name in INDEX_FILES:
+        try:
+            stat = os.stat(os.path.join(vector_store_path, name))
+        except OSError:
+            return None
+        parts.append(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    return "-".join(parts)
+
+
+def _folder_bytes(vector_store_path):
+    """Approximate in-memory size of a vector store by its size on disk."""
+    total = 0
+    for name in os.listdir(vector_store_path):
+        file_path = os.path.join(vector_store_path, name)
+        if os.path.isfile(file_path):
+            total += os.path.getsize(file_path)
+    return total
+
+
+def subject_memory(vector_store_path, store):
+    """Approximate memory held for one subject: its index, as sized on disk, and its stored embeddings."""
+    chunks = open_chunks(vector_store_path)
+    try:
+        index_bytes = os.path.getsize(os.path.join(vector_store_path, "index.faiss"))
+    except OSError:
+        index_bytes = 0
+    return {
+        "index_type": index_type_of(store.index),
+        "index_quantization": index_quantization_of(store.index),
+        "index_bytes": index_bytes,
+        "embedding_quantization": chunks.quantization if chunks is not None else None,
+        "embedding_bytes": chunks.embedding_bytes() if chunks is not None else 0,
+    }
+
+
+def save_index(vector_store, vector_store_path, stamp):
+    """
+    Save a FAISS vector store in the layout of FAISS.save_local (index.faiss and index.pkl).
+    Both files are written to temporary names and renamed into place, then `stamp` is
+    written last; it must be the stamp the chunk store was saved with.
+    """
+    os.makedirs(vector_store_path, exist_ok=True)
+    faiss_tmp = os.path.join(vector_store_path, "index.faiss.tmp")
+    pkl_tmp = os.path.join(vector_store_path, "index.pkl.tmp")
+    faiss.write_index(vector_store.index, faiss_tmp)
+    with open(pkl_tmp, "wb") as f:
+        pickle.dump((vector_store.docstore, vector_store.index_to_docstore_id), f)
+
+    write_stamp(vector_store_path, INDEX_STAMP_FILE, PENDING_STAMP)
+    os.replace(faiss_tmp, os.path.join(vector_store_path, "index.faiss"))
+    os.replace(pkl_tmp, os.path.join(vector_store_path, "index.pkl"))
+    write_stamp(vector_store_path, INDEX_STAMP_FILE, stamp)
+    vector_store.stamp = stamp
+
+
+def load_vector_store(vector_store_path):
+    """
+    Load a subject's FAISS vector store from disk.
+    The docstore is rebuilt from the persisted chunk store instead of unpickling index.pkl,
+    once the index and the chunk store carry the same stamp. While /chunk is rewriting
+    them this waits up to STAMP_WAIT_SECONDS; the pickle is only read for stores saved
+    before chunks were persisted, or if the two never agree.
+    The returned store's `stamp` is the version it was loaded at.
+    """
+    deadline = time.monotonic() + STAMP_WAIT_SECONDS
+    while True:
+        version = index_version(vector_store_path)
+        waiting = time.monotonic() < deadline
+        if version == PENDING_STAMP and waiting:
+            time.sleep(0.02)
+            continue
+
+        stamped = read_stamp(vector_store_path, INDEX_STAMP_FILE) is not None
+        index = configure_search(faiss.read_index(os.path.join(vector_store_path, "index.faiss")))
+        chunks = open_chunks(vector_store_path)
+        if (
+            chunks is not None
+            and len(chunks) == index.ntotal
+            and (not stamped or chunks.version == version)
+            and index_version(vector_store_path) == version
+        ):
+            break
+        if not stamped or not waiting:
+            store = FAISS.load_local(vector_store_path, get_embedding_model(), allow_dangerous_deserialization=True)
+            store.stamp = version
+            return store
+        time.sleep(0.02)
+
+    documents = chunks.documents()
+    docstore = InMemoryDocstore({doc.id: doc for doc in documents})
+    index_to_docstore_id = {i: doc.id for i, doc in enumerate(documents)}
+    store = FAISS(get_embedding_model(), index, docstore, index_to_docstore_id)
+    store.stamp = version
+    return store
+
+
+class VectorStoreCache:
+    """Per-subject LRU cache of loaded FAISS vector stores."""
+
+    def __init__(self, max_subjects=VECTOR_CACHE_MAX_SUBJECTS, max_bytes=VECTOR_CACHE_MAX_BYTES):
+        self.max_subjects = max_subjects
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def get(self, subject, vector_store_path):
+        """Return the vector store for a subject, loading it from disk on a miss or version change."""
+        version = index_version(vector_store_path)
+        if version is None:
+            raise FileNotFoundError(f"Vector store for '{subject}' not found.")
+
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is not None and entry["version"] == version:
+                self._entries.move_to_end(subject)
+                self.hits += 1
+                return entry["store"]
+            load_lock = self._load_locks.setdefault(subject, threading.Lock())
+
+        # Only one thread loads a given subject; the others wait and reuse its result
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(subject)
+                if entry is not None and entry["version"] == version:
+                    self._entries.move_to_end(subject)
+                    self.hits += 1
+                    return entry["store"]
+                self.misses += 1
+
+            start = time.perf_counter()
+            store = load_vector_store(vector_store_path)
+            elapsed = time.perf_counter() - start
+            record_stage("load_vector_store", elapsed)
+
+            with self._lock:
+                self.load_seconds += elapsed
+                self._insert(subject, vector_store_path, store, store.stamp)
+            return store
+
+    def put(self, subject, vector_store_path, store):
+        """Cache a vector store that was just built and saved to disk."""
+        version = getattr(store, "stamp", None) or index_version(vector_store_path)
+        with self._lock:
+            self._insert(subject, vector_store_path, store, version)
+
+    def invalidate(self, subject):
+        """Drop the cached vector store for a subject."""
+        with self._lock:
+            self._entries.pop(subject, None)
+
+    def _insert(self, subject, vector_store_path, store, version):
+        self._entries[subject] = {
+            "store": store,
+            "version": version,
+            "bytes": _folder_bytes(vector_store_path),
+            "memory": subject_memory(vector_store_path, store),
+        }
+        self._entries.move_to_end(subject)
+        self._evict()
+
+    def _evict(self):
+        """Evict least recently used subjects until the cache is within its limits."""
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_subjects or self._total_bytes() > self.max_bytes
+        ):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _total_bytes(self):
+        return sum(entry["bytes"] for entry in self._entries.values())
+
+    def stats(self):
+        """Return cache counters and the currently cached subjects."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "subjects": list(self._entries.keys()),
+                "memory": {subject: entry["memory"] for subject, entry in self._entries.items()},
+                "bytes": self._total_bytes(),
+                "max_subjects": self.max_subjects,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "load_seconds": round(self.load_seconds, 3),
+            }
@@ -71,6 +71,19 @@ const Chatbot = ({ subject, onQuerySubmit, onStart }) => {
       );
   
       console.log("Chunk response:", chunkResponse.data);
+
+      // Chunking runs as a background job; wait until it finishes
+      const jobId = chunkResponse.data.jobId;
+      let job = chunkResponse.data;
+      while (job.status !== "done" && job.status !== "failed") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobResponse = await axios.get(`http://localhost:5000/jobs/${jobId}`);
+        job = jobResponse.data;
+        console.log(`Chunk job ${job.stage}: ${job.percent}%`);
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Chunking failed");
+      }
   
       // Initialize the model
       const modelResponse = await axios.post(
@@ -23,27 +23,49 @@ const FileUpload = ({ subject, onFileUpload }) => {
       return;
     }
 
-    const formData = new FormData();
-    files.forEach((file) => {
-      formData.append('files', file);
-    });
-    formData.append('subject', subject);
-
     try {
-      await axios.post('http://localhost:5000/upload', formData, {
-        headers: { 'Content-Type': 'multipart/form-data' },
-      });
+      let response = await sendFiles(files, false);
+
+      // Same name but different content: ask before overwriting
+      if (response.status === 409) {
+        const names = response.data.conflicts.map((conflict) => conflict.fileName);
+        if (window.confirm(`These files already exist with different content:\n${names.join('\n')}\n\nReplace them?`)) {
+          const replaced = await sendFiles(files.filter((file) => names.includes(file.name)), true);
+          response = { data: { ...replaced.data, files: [...response.data.files, ...replaced.data.files] } };
+        }
+      }
 
-      alert(`Files uploaded successfully for ${subject}.`);
+      // Identical content is not stored twice; point at the existing copy instead
+      const duplicates = response.data.files.filter((file) => file.duplicate);
+      const stored = response.data.files.length - duplicates.length;
+      let message = `${stored} file(s) uploaded for ${subject}.`;
+      if (duplicates.length) {
+        message += `\n${duplicates.length} already uploaded: ${duplicates.map((file) => file.fileName).join(', ')}`;
+      }
+      alert(message);
       await onFileUpload(); // Refresh file list
       setFiles([]);
       if (fileInputRef.current) fileInputRef.current.value = ""; // Reset file input
     } catch (error) {
       console.error('Upload failed:', error);
-      alert('Error uploading files.');
+      alert(error.response?.data?.error || 'Error uploading files.');
     }
   };
 
+  const sendFiles = (filesToSend, replace) => {
+    const formData = new FormData();
+    filesToSend.forEach((file) => {
+      formData.append('files', file);
+    });
+    formData.append('subject', subject);
+    if (replace) formData.append('replace', 'true');
+
+    return axios.post('http://localhost:5000/upload', formData, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+      validateStatus: (status) => status === 200 || status === 409,
+    });
+  };
+
   return (
     <div>
       <h3>Upload Files for {subject}</h3>
@@ -10,16 +10,22 @@ export const Home = () => {
   const [classes, setClasses] = useState([]);
   const [searchTerm, setSearchTerm] = useState("");
   const [errorMessage, setErrorMessage] = useState("");
+  const [nextCursor, setNextCursor] = useState(null);
+
+  // Fetch one page of classes with only the columns the cards show
+  const fetchClasses = async (after = 0) => {
+    try {
+      const response = await axios.get("http://localhost:5001/classes", {
+        params: { after, limit: 50, fields: "id,title,teacher,description" },
+      });
+      setClasses((previous) => (after ? [...previous, ...response.data.classes] : response.data.classes));
+      setNextCursor(response.data.nextCursor);
+    } catch (error) {
+      setErrorMessage("Failed to fetch classes. Please try again.");
+    }
+  };
 
   useEffect(() => {
-    const fetchClasses = async () => {
-      try {
-        const response = await axios.get("http://localhost:5001/classes");
-        setClasses(response.data.classes);
-      } catch (error) {
-        setErrorMessage("Failed to fetch classes. Please try again.");
-      }
-    };
     fetchClasses();
   }, []);
 
@@ -85,6 +91,11 @@ export const Home = () => {
           <p>No classes available.</p>
         )}
       </div>
+      {nextCursor && (
+        <button className="create-class-button" onClick={() => fetchClasses(nextCursor)}>
+          Load more
+        </button>
+      )}
     </div>
   );
 };
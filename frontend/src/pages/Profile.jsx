@@ -24,6 +24,21 @@ const Profile = () => {
   ];
 
   useEffect(() => {
+    // The class listings are paginated; follow nextCursor until the last page
+    const fetchAllPages = async (url) => {
+      let rows = [];
+      let after = 0;
+      do {
+        const response = await axios.get(url, {
+          headers: { Authorization: userId },
+          params: { after, limit: 200 },
+        });
+        rows = rows.concat(response.data.classes);
+        after = response.data.nextCursor;
+      } while (after);
+      return rows;
+    };
+
     const fetchProfile = async () => {
       setLoading(true);
       try {
@@ -35,25 +50,21 @@ const Profile = () => {
         setFormData(response.data.user);
 
         // Fetch assessments (assuming backend doesn't return completed field)
-        const assessmentsResponse = await axios.get("http://localhost:5001/assessments", {
-          headers: { Authorization: userId },
-        });
+        const assessmentClasses = await fetchAllPages("http://localhost:5001/assessments");
 
         // Add `completed` field to each assessment if not present
-        const assessmentsWithStatus = assessmentsResponse.data.classes.map(assessment => ({
+        const assessmentsWithStatus = assessmentClasses.map(assessment => ({
           ...assessment,
           completed: localStorage.getItem(`assessment-${assessment.id}`) === "true", // Load the state from localStorage
         }));
         setAssessments(assessmentsWithStatus);
 
         // Fetch class hours
-        const classHoursResponse = await axios.get("http://localhost:5001/total-hours", {
-          headers: { Authorization: userId },
-        });
+        const classHoursClasses = await fetchAllPages("http://localhost:5001/total-hours");
 
         // Check if the structure is as expected
-        if (Array.isArray(classHoursResponse.data.classes)) {
-          const classHoursMap = classHoursResponse.data.classes.reduce((acc, classInfo) => {
+        if (Array.isArray(classHoursClasses)) {
+          const classHoursMap = classHoursClasses.reduce((acc, classInfo) => {
             const { title, total_hours } = classInfo;
             acc[title] = {
               totalHours: total_hours,